@@ -1,5 +1,39 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Union, Literal, Dict, Any
+from enum import Enum
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Union, Literal, Dict, Any, Annotated
+
+# --- Enumerated Style Values ---
+# str-based enums: validated through pydantic-core's enum path and still
+# serialized as plain strings (e.g. "primary")
+
+class TextVariant(str, Enum):
+    H1 = "h1"
+    H2 = "h2"
+    H3 = "h3"
+    BODY = "body"
+    CAPTION = "caption"
+    LABEL = "label"
+
+class ButtonVariant(str, Enum):
+    PRIMARY = "primary"
+    SECONDARY = "secondary"
+    OUTLINE = "outline"
+    GHOST = "ghost"
+
+class Direction(str, Enum):
+    ROW = "row"
+    COLUMN = "column"
+
+class Alignment(str, Enum):
+    START = "start"
+    CENTER = "center"
+    END = "end"
+    STRETCH = "stretch"
+
+class Orientation(str, Enum):
+    VERTICAL = "vertical"
+    HORIZONTAL = "horizontal"
+    GRID = "grid"
 
 # --- Base Components ---
 
@@ -7,13 +41,19 @@ class A2UIComponent(BaseModel):
     id: Optional[str] = None
     type: str
 
+# Leaf components are immutable once built
+
 class Text(A2UIComponent):
+    model_config = ConfigDict(frozen=True)
+
     type: Literal["text"] = "text"
     content: str
-    variant: Literal["h1", "h2", "h3", "body", "caption", "label"] = "body"
+    variant: TextVariant = TextVariant.BODY
     color: Optional[str] = None
 
 class Image(A2UIComponent):
+    model_config = ConfigDict(frozen=True)
+
     type: Literal["image"] = "image"
     src: str
     alt: str
@@ -21,19 +61,24 @@ class Image(A2UIComponent):
     height: Optional[str] = None
 
 class Button(A2UIComponent):
+    model_config = ConfigDict(frozen=True)
+
     type: Literal["button"] = "button"
     label: str
     action_id: str
-    variant: Literal["primary", "secondary", "outline", "ghost"] = "primary"
+    variant: ButtonVariant = ButtonVariant.PRIMARY
     payload: Optional[Dict[str, Any]] = None
 
 class Box(A2UIComponent):
     type: Literal["box"] = "box"
-    children: List[Union["Text", "Image", "Button", "Box", "Card", "List"]] = []
-    direction: Literal["row", "column"] = "column"
+    children: List[Annotated[
+        Union["Text", "Image", "Button", "Box", "Card", "ListComponent"],
+        Field(discriminator="type")
+    ]] = []
+    direction: Direction = Direction.COLUMN
     gap: Optional[str] = None
     padding: Optional[str] = None
-    alignment: Literal["start", "center", "end", "stretch"] = "start"
+    alignment: Alignment = Alignment.START
 
 # --- Composite Components ---
 
@@ -42,13 +87,13 @@ class Card(A2UIComponent):
     title: Optional[str] = None
     subtitle: Optional[str] = None
     image: Optional[Image] = None
-    content: List[Union[Text, Box]] = []
+    content: List[Annotated[Union[Text, Box], Field(discriminator="type")]] = []
     actions: List[Button] = []
 
 class ListComponent(A2UIComponent):
     type: Literal["list"] = "list"
     items: List[Card]
-    orientation: Literal["vertical", "horizontal", "grid"] = "vertical"
+    orientation: Orientation = Orientation.VERTICAL
 
 # --- Root Message ---
 
@@ -57,7 +102,11 @@ class A2UIMessage(BaseModel):
     Top-level container for an A2UI message.
     """
     type: Literal["a2ui"] = "a2ui"
-    root: Union[Box, Card, ListComponent, Text]
+    # Tagged on "type" so validation dispatches straight to the matching component
+    root: Union[Box, Card, ListComponent, Text] = Field(discriminator="type")
 
-# Update forward references for recursive Box definition
-Box.update_forward_refs()
+# Resolve forward references for the recursive Box definition (Card and
+# ListComponent are declared after it), then rebuild the models that embed Box
+Box.model_rebuild()
+Card.model_rebuild()
+A2UIMessage.model_rebuild()
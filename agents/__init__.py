@@ -3,6 +3,14 @@ Core agent implementations for the shopping assistant
 """
 
 from .search_agents import eBaySearch, RainforestSearch
-from .research_agent import ResearchAgent
 
 __all__ = ['eBaySearch', 'RainforestSearch', 'ResearchAgent']
+
+
+def __getattr__(name):
+    # ResearchAgent pulls in the openai SDK; load it only when asked for, so the
+    # eBay/Amazon servers don't pay that import cost at startup
+    if name == 'ResearchAgent':
+        from .research_agent import ResearchAgent
+        return ResearchAgent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,41 +4,152 @@ Research Agent - Specialized AI agent for product verification and web search
 This agent uses web search to verify product existence and gather current information
 """
 
+import asyncio
 import os
+import threading
+import httpx
+import orjson
 import requests
-from typing import Dict, Optional
-from openai import OpenAI
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from cachetools import TTLCache
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+from .search_agents import create_http_session, request_with_retries
 
 load_dotenv()
 
+# Verdicts are reused for a day; product existence changes slowly
+VERIFICATION_CACHE_TTL = 86400
+# Low-confidence "not found" verdicts (misspellings, made-up models) are reused
+# briefly, so a user retrying the same query doesn't pay for Serper and the AI again
+NEGATIVE_CACHE_TTL = 600
+SERPER_URL = "https://google.serper.dev/search"
+SERPER_TIMEOUT = 10  # Seconds; a hung search shouldn't hold a worker thread
+VERIFICATION_MODEL = "google/gemini-2.5-flash-lite"  # Faster model for quick analysis
+# The verdict is a small JSON object; the cap bounds latency and cost
+VERIFICATION_MAX_TOKENS = 256
+# Search results given to the AI, and how much of each snippet: the top hits
+# settle an existence check, and prompt size drives the analysis latency
+VERIFICATION_RESULTS = 3
+SNIPPET_MAX_CHARS = 200
+
+# Verdicts when the search finds nothing to analyze, or the search or the
+# analysis fails. Only the first is a real "not found" (negative-cached);
+# an error verdict lets the search proceed and is retried next time.
+NO_RESULTS_VERDICT = {
+    "exists": False,
+    "info": "Unable to find information about this product.",
+    "confidence": "low"
+}
+ERROR_VERDICT = {
+    "exists": True,  # Default to true to avoid blocking searches
+    "info": "Unable to verify product details, but proceeding with search.",
+    "confidence": "low"
+}
+_QUERY_PUNCTUATION = str.maketrans("", "", ".,!?;:'\"")
+
+
+@lru_cache(maxsize=1)
+def _format_date(today: date) -> str:
+    """Prompt date ("February 16, 2026"); cached so it is only formatted when the day changes."""
+    return today.strftime("%B %d, %Y")
+
+
+def normalize_product_query(product_name: str) -> str:
+    """Normalize a product query for use as a cache key (case, whitespace and punctuation insensitive)."""
+    return " ".join(product_name.lower().translate(_QUERY_PUNCTUATION).split())
+
+
 class ResearchAgent:
     """
     An AI agent specialized in researching products using web search.
     It can verify if products exist and gather current information about them.
     """
     
-    def __init__(self, openrouter_api_key: str, serper_api_key: str):
+    def __init__(
+        self,
+        openrouter_api_key: str,
+        serper_api_key: str,
+        session: Optional[requests.Session] = None,
+        verification_cache: Optional[Any] = None
+    ):
         """
         Initialize the research agent with API keys
         
         Args:
             openrouter_api_key: API key for OpenRouter (AI)
             serper_api_key: API key for Serper (web search)
+            session: Optional shared requests.Session (keep-alive connection pool);
+                     by default one that retries Serper rate limits (429) and 5xx
+            verification_cache: Optional cache for verdicts (get()/item assignment,
+                                e.g. a persistent SharedTTLCache); defaults to an
+                                in-process TTLCache
         """
         self.serper_api_key = serper_api_key
+        # Serper searches are POSTs but read-only, so they are safe to retry
+        self._owns_session = session is None
+        self.session = session or create_http_session(retry_post=True)
+        # Same headers for every search; built once
+        self._serper_headers = {
+            "X-API-KEY": serper_api_key,
+            "Content-Type": "application/json"
+        }
         
-        # Initialize AI client for analysis
-        self.ai_client = OpenAI(
+        # verify_product may run on several worker threads at once
+        self._verification_cache = (
+            verification_cache if verification_cache is not None
+            else TTLCache(maxsize=1024, ttl=VERIFICATION_CACHE_TTL)
+        )
+        self._negative_cache = TTLCache(maxsize=4096, ttl=NEGATIVE_CACHE_TTL)
+        # In-process caches are cheap enough to use directly from the event loop
+        self._local_cache = isinstance(self._verification_cache, TTLCache)
+        self._verification_lock = threading.Lock()
+        # Uncached verifications in progress on the event loop, by normalized query key
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Initialize AI clients for analysis (verify_product / verify_product_async)
+        ai_client_options = dict(
             base_url="https://openrouter.ai/api/v1",
             api_key=openrouter_api_key,
             default_headers={
                 "HTTP-Referer": "http://localhost",
                 "X-Title": "Research-Agent"
             },
+            timeout=20.0,
+            max_retries=2,
         )
+        self.ai_client = OpenAI(**ai_client_options)
+        # The async client is created on first use (see async_ai_client); callers
+        # that only verify synchronously (api.py) never open its connection pool
+        self._ai_client_options = ai_client_options
+        self._async_ai_client: Optional[AsyncOpenAI] = None
     
-    def web_search(self, query: str, num_results: int = 5) -> Dict:
+    @property
+    def async_ai_client(self) -> AsyncOpenAI:
+        """Async AI client; multiplexes concurrent verifications over pooled HTTP/2 connections to OpenRouter"""
+        if self._async_ai_client is None:
+            self._async_ai_client = AsyncOpenAI(
+                **self._ai_client_options,
+                http_client=httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=10)
+                )
+            )
+        return self._async_ai_client
+    
+    def close(self):
+        """Close the connection pool (unless it is a shared session)."""
+        if self._owns_session:
+            self.session.close()
+    
+    async def aclose(self):
+        """Close the async AI client (and its HTTP/2 connection pool), if it was created."""
+        if self._async_ai_client is not None:
+            await self._async_ai_client.close()
+    
+    def web_search(self, query: str, num_results: int = 5) -> Optional[Dict]:
         """
         Perform a web search using Serper API
         
@@ -47,27 +158,50 @@ class ResearchAgent:
             num_results: Number of results to return
             
         Returns:
-            Dictionary containing search results
+            Dictionary containing search results (None if the search failed,
+            as opposed to finding nothing)
         """
-        url = "https://google.serper.dev/search"
-        
         payload = {
             "q": query,
             "num": num_results
         }
         
-        headers = {
-            "X-API-KEY": self.serper_api_key,
-            "Content-Type": "application/json"
+        try:
+            response = self.session.post(SERPER_URL, json=payload, headers=self._serper_headers, timeout=SERPER_TIMEOUT)
+            response.raise_for_status()
+            return orjson.loads(response.content)
+        except Exception as e:
+            print(f"Error performing web search: {e}")
+            return None
+    
+    async def web_search_async(self, query: str, client: httpx.AsyncClient, num_results: int = 5) -> Optional[Dict]:
+        """
+        Perform a web search like web_search, on an async HTTP client
+        
+        Args:
+            query: Search query
+            client: Shared httpx.AsyncClient (keep-alive connection pool)
+            num_results: Number of results to return
+            
+        Returns:
+            Dictionary containing search results (None on failure)
+        """
+        payload = {
+            "q": query,
+            "num": num_results
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            # Serper searches are read-only, so rate limits and 5xx are retried
+            response = await request_with_retries(
+                client, "POST", SERPER_URL,
+                content=orjson.dumps(payload), headers=self._serper_headers, timeout=SERPER_TIMEOUT
+            )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             print(f"Error performing web search: {e}")
-            return {}
+            return None
     
     def verify_product(self, product_name: str) -> Dict[str, any]:
         """
@@ -82,26 +216,125 @@ class ResearchAgent:
                 - info: str (information about the product)
                 - confidence: str (high/medium/low)
         """
+        key = normalize_product_query(product_name)
+        cached = self._cached_verdict(key)
+        if cached is not None:
+            print(f"⚡ Verification cache hit: {key}")
+            return cached
+        
         # Step 1: Search the web for the product
-        search_query = f"{product_name} official release date specs"
-        search_results = self.web_search(search_query, num_results=5)
+        search_results = self.web_search(self._search_query(product_name), num_results=VERIFICATION_RESULTS)
         
-        if not search_results or "organic" not in search_results:
-            return {
-                "exists": False,
-                "info": "Unable to find information about this product.",
-                "confidence": "low"
-            }
+        # Steps 2-3: Extract context and analyze it with AI
+        analysis = self._analyze_search_results(product_name, search_results)
+        self._cache_verdict(key, analysis)
         
-        # Step 2: Extract relevant information from search results
-        context = self._extract_search_context(search_results)
-        print(f"🔍 Research Agent Context:\n{context}") # DEBUG PRINT
+        return analysis
+    
+    async def verify_product_async(self, product_name: str, client: httpx.AsyncClient) -> Dict[str, any]:
+        """
+        Verify a product like verify_product, without blocking the event loop
         
-        # Step 3: Use AI to analyze the search results
-        analysis = self._analyze_with_ai(product_name, context)
+        Args:
+            product_name: Name of the product to verify
+            client: Shared httpx.AsyncClient for the web search
+            
+        Returns:
+            Same dictionary as verify_product
+        """
+        key = normalize_product_query(product_name)
+        if self._local_cache:
+            cached = self._cached_verdict(key)
+        else:
+            # A persistent cache (SQLite/Redis) is read off the event loop
+            cached = await asyncio.to_thread(self._cached_verdict, key)
+        if cached is not None:
+            print(f"⚡ Verification cache hit: {key}")
+            return cached
+        
+        # Concurrent requests for the same product share one search and analysis
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._verify_uncached_async(product_name, key, client))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            print(f"⚡ Verification already in flight: {key}")
+        # Shielded, so one cancelled caller doesn't cancel the others' verification
+        return await asyncio.shield(task)
+    
+    async def _verify_uncached_async(self, product_name: str, key: str, client: httpx.AsyncClient) -> Dict[str, any]:
+        """Search and analyze a product, then cache the verdict under its key"""
+        search_results = await self.web_search_async(self._search_query(product_name), client, num_results=VERIFICATION_RESULTS)
+        
+        if search_results is None:
+            analysis = dict(ERROR_VERDICT)
+        elif (context := self._search_context(search_results)) is None:
+            analysis = dict(NO_RESULTS_VERDICT)
+        else:
+            analysis = await self._analyze_with_ai_async(product_name, context)
+        if self._local_cache:
+            self._cache_verdict(key, analysis)
+        else:
+            await asyncio.to_thread(self._cache_verdict, key, analysis)
         
         return analysis
     
+    @staticmethod
+    def _search_query(product_name: str) -> str:
+        """Web search query used to verify a product"""
+        return f"{product_name} official release date specs"
+    
+    def _analyze_search_results(self, product_name: str, search_results: Dict) -> Dict[str, any]:
+        """
+        Turn raw search results for a product into a verification verdict
+        
+        Args:
+            product_name: Name of the product
+            search_results: Raw search results from Serper (None if the search failed)
+            
+        Returns:
+            Dictionary with analysis results
+        """
+        if search_results is None:
+            return dict(ERROR_VERDICT)
+        context = self._search_context(search_results)
+        if context is None:
+            return dict(NO_RESULTS_VERDICT)
+        
+        # Use AI to analyze the search results
+        return self._analyze_with_ai(product_name, context)
+    
+    def _search_context(self, search_results: Dict) -> Optional[str]:
+        """Context for the AI from raw search results (None if there are no results)"""
+        if not search_results or "organic" not in search_results:
+            return None
+        
+        # Extract relevant information from search results
+        context = self._extract_search_context(search_results)
+        print(f"🔍 Research Agent Context:\n{context}") # DEBUG PRINT
+        return context
+    
+    def _cached_verdict(self, key: str) -> Optional[Dict[str, any]]:
+        """Cached verdict for a normalized query key (None on a miss)"""
+        with self._verification_lock:
+            cached = self._verification_cache.get(key)
+            if cached is None:
+                cached = self._negative_cache.get(key)
+        return cached
+    
+    def _cache_verdict(self, key: str, analysis: Dict[str, any]):
+        """Cache a verdict under its normalized query key"""
+        if analysis.get("confidence") in ("high", "medium"):
+            with self._verification_lock:
+                self._verification_cache[key] = analysis
+        # Other low-confidence verdicts are only kept briefly: "not found" may be a
+        # passing search error. (A low-confidence verdict never blocks a search.)
+        # The AI-error fallback (exists=True) is retried.
+        elif not analysis.get("exists"):
+            with self._verification_lock:
+                self._negative_cache[key] = analysis
+    
     def _extract_search_context(self, search_results: Dict) -> str:
         """
         Extract relevant text from search results
@@ -116,9 +349,9 @@ class ResearchAgent:
         
         # Extract organic results
         if "organic" in search_results:
-            for i, result in enumerate(search_results["organic"][:5], 1):
+            for i, result in enumerate(search_results["organic"][:VERIFICATION_RESULTS], 1):
                 title = result.get("title", "")
-                snippet = result.get("snippet", "")
+                snippet = result.get("snippet", "")[:SNIPPET_MAX_CHARS]
                 context_parts.append(f"{i}. {title}\n   {snippet}")
         
         # Extract knowledge graph if available
@@ -142,8 +375,40 @@ class ResearchAgent:
         Returns:
             Dictionary with analysis results
         """
-        from datetime import datetime
-        current_date = datetime.now().strftime("%B %d, %Y")
+        try:
+            response = self.ai_client.chat.completions.create(
+                model=VERIFICATION_MODEL,
+                messages=self._analysis_messages(product_name, search_context),
+                temperature=0.3,  # Lower temperature for more factual responses
+                response_format={"type": "json_object"},  # Bare JSON, no markdown fences
+                max_tokens=VERIFICATION_MAX_TOKENS
+            )
+            return self._parse_verdict(response.choices[0].message.content)
+            
+        except Exception as e:
+            print(f"Error analyzing with AI: {e}")
+            return dict(ERROR_VERDICT)
+    
+    async def _analyze_with_ai_async(self, product_name: str, search_context: str) -> Dict[str, any]:
+        """Async counterpart of _analyze_with_ai (same prompt and parsing)"""
+        try:
+            response = await self.async_ai_client.chat.completions.create(
+                model=VERIFICATION_MODEL,
+                messages=self._analysis_messages(product_name, search_context),
+                temperature=0.3,  # Lower temperature for more factual responses
+                response_format={"type": "json_object"},  # Bare JSON, no markdown fences
+                max_tokens=VERIFICATION_MAX_TOKENS
+            )
+            return self._parse_verdict(response.choices[0].message.content)
+            
+        except Exception as e:
+            print(f"Error analyzing with AI: {e}")
+            return dict(ERROR_VERDICT)
+    
+    @staticmethod
+    def _analysis_messages(product_name: str, search_context: str) -> List[Dict[str, str]]:
+        """Chat messages asking the AI for a verdict on the search results"""
+        current_date = _format_date(date.today())
         
         prompt = f"""Today's date is {current_date}.
 
@@ -183,36 +448,27 @@ Based on these search results, provide a JSON response with:
 
 Respond ONLY with valid JSON, no other text.
 """
-        
+        return [
+            {"role": "system", "content": "You are a research analyst. Respond only with valid JSON."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @staticmethod
+    def _parse_verdict(result_text: str) -> Dict[str, any]:
+        """Parse the AI's JSON verdict (raises on invalid JSON)"""
+        # JSON mode returns a bare object, parsed directly
         try:
-            response = self.ai_client.chat.completions.create(
-                model="google/gemini-2.5-flash-lite",  # Using faster model for quick analysis
-                messages=[
-                    {"role": "system", "content": "You are a research analyst. Respond only with valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3  # Lower temperature for more factual responses
-            )
-            
-            import json
-            result_text = response.choices[0].message.content.strip()
-            
-            # Try to extract JSON if wrapped in markdown code blocks
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0].strip()
-            
-            analysis = json.loads(result_text)
-            return analysis
-            
-        except Exception as e:
-            print(f"Error analyzing with AI: {e}")
-            return {
-                "exists": True,  # Default to true to avoid blocking searches
-                "info": "Unable to verify product details, but proceeding with search.",
-                "confidence": "low"
-            }
+            return orjson.loads(result_text)
+        except orjson.JSONDecodeError:
+            pass
+        
+        # Fallback for a provider that ignores response_format: extract JSON
+        # wrapped in markdown code blocks
+        if "```json" in result_text:
+            result_text = result_text.split("```json")[1].split("```")[0]
+        elif "```" in result_text:
+            result_text = result_text.split("```")[1].split("```")[0]
+        return orjson.loads(result_text.strip())
 
 
 # Example usage
@@ -5,15 +5,27 @@ Searches eBay and Amazon products using their respective APIs,
 orchestrated by a Gemini AI assistant.
 """
 
+import asyncio
+import httpx
+import orjson
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
 import os
+import threading
+import time
+from itertools import islice
 from typing import Dict, List, Optional
-# import google.generativeai as genai
-from openai import OpenAI
 from dotenv import load_dotenv
 
+# ijson is optional: with it, RainforestSearch.search_items(top_n=...) parses only
+# the first few results of a large response instead of the whole document
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # --- Load All API Keys from .env file ---
 load_dotenv()
 EBAY_CLIENT_ID = os.environ.get("EBAY_CLIENT_ID")
@@ -24,51 +36,206 @@ OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
 #AMAZON_API_ENDPOINT = os.environ.get("AMAZON_API_ENDPOINT") # The POST URL for your Bright Data scraper
 RAINFOREST_API_KEY = os.environ.get("RAINFOREST_API_KEY")
 
+# eBay application tokens last ~2 hours; they are reused across restarts via this
+# file and renewed this many seconds before they expire
+EBAY_TOKEN_CACHE = os.environ.get("EBAY_TOKEN_CACHE", os.path.expanduser("~/.cache/ebay_token.json"))
+TOKEN_REFRESH_MARGIN = 60
+
+# Searches run on worker threads; past this many in flight per API, callers wait
+# for a slot instead of piling on requests that end in 429 rate-limit errors
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Below this size a response is parsed whole; streaming overhead isn't worth it
+STREAM_MIN_BYTES = 32 * 1024
+
+# Statuses retried (twice, with backoff) by both the sync and the async clients
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Separators for the console result listings
+RULE = "=" * 80
+ITEM_RULE = "-" * 78
+
+
+def create_http_session(pool_maxsize: int = 8, retry_post: bool = False) -> requests.Session:
+    """
+    Create a keep-alive requests.Session for the marketplace APIs.
+    
+    Connections are pooled per host, so repeat searches skip the TCP+TLS
+    handshake. Rate limits (429) and transient 5xx errors on idempotent requests
+    are retried twice with a short backoff, honoring any Retry-After header;
+    POSTs (the OAuth token) are not, unless retry_post is set.
+    
+    Args:
+        pool_maxsize: Connections kept per host (size it for concurrent callers)
+        retry_post: Also retry POSTs, for APIs where a POST is a read-only query
+    
+    Returns:
+        The configured session
+    """
+    session = requests.Session()
+    allowed_methods = Retry.DEFAULT_ALLOWED_METHODS | {"POST"} if retry_post else Retry.DEFAULT_ALLOWED_METHODS
+    retries = Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=allowed_methods
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retries))
+    return session
+
+
+async def request_with_retries(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request with the same retry policy as create_http_session, for async callers.
+    
+    Rate limits (429) and transient 5xx responses are retried twice with a short
+    exponential backoff, waiting for a Retry-After header instead when present.
+    Only use it for requests that are safe to repeat.
+    
+    Args:
+        client: Shared httpx.AsyncClient
+        method: HTTP method
+        url: URL to request
+        **kwargs: Passed on to client.request (params, headers, json, ...)
+    
+    Returns:
+        The last response (status not checked)
+    """
+    for attempt in range(3):
+        response = await client.request(method, url, **kwargs)
+        if response.status_code not in RETRY_STATUSES or attempt == 2:
+            return response
+        retry_after = response.headers.get("Retry-After", "")
+        await asyncio.sleep(min(float(retry_after), 10.0) if retry_after.isdigit() else 0.2 * 2 ** attempt)
+    return response
+
+
 # ==============================================================================
 # eBaySearch CLASS (No changes here)
 # ==============================================================================
 class eBaySearch:
     """Class to handle eBay API searches."""
     
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        session: Optional[requests.Session] = None,
+        token_cache_path: Optional[str] = EBAY_TOKEN_CACHE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
         """
         Initialize eBay Search with API credentials.
         
         Args:
             client_id: eBay Application Client ID
             client_secret: eBay Application Client Secret
+            session: Optional shared requests.Session (keep-alive connection pool)
+            token_cache_path: File the access token is kept in between runs (None disables it)
+            max_concurrency: Most searches sent to eBay at once
         """
         self.client_id = client_id
         self.client_secret = client_secret
+        self._owns_session = session is None
+        self.session = session or create_http_session()
         self.access_token = None
+        self.token_expiry = 0.0  # Unix time the access token stops being valid
+        self.token_cache_path = token_cache_path
+        self._token_lock = threading.Lock()  # Searches run on several threads
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = asyncio.Semaphore(max_concurrency)  # Same cap for search_items_async
         # Using Production URLs as seen in your .env file
         self.base_url = "https://api.ebay.com"
         self.token_url = "https://api.ebay.com/identity/v1/oauth2/token"
         self.search_endpoint = "/buy/browse/v1/item_summary/search"
+        self._search_url = f"{self.base_url}{self.search_endpoint}"
+        self._search_headers: Dict[str, str] = {}  # Rebuilt when the token changes
+        # The token request never changes for an app; built once for every refresh
+        credentials = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+        self._token_headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Authorization": f"Basic {credentials}"
+        }
+        self._token_body = {
+            "grant_type": "client_credentials",
+            "scope": "https://api.ebay.com/oauth/api_scope"
+        }
+        
+    def _set_token(self, access_token: Optional[str], expiry: float):
+        """Install a token and the search headers that carry it."""
+        self.access_token = access_token
+        self.token_expiry = expiry
+        # Replaced rather than mutated, so concurrent searches never see a half-updated dict
+        self._search_headers = {
+            "Authorization": f"Bearer {access_token}",
+            "X-EBAY-C-MARKETPLACE-ID": "EBAY_US",
+            "Content-Type": "application/json"
+        }
+    
+    def _token_valid(self) -> bool:
+        return bool(self.access_token) and time.time() < self.token_expiry - TOKEN_REFRESH_MARGIN
+    
+    def _load_cached_token(self) -> bool:
+        """Reuse a still-valid token saved by an earlier run (for the same app)."""
+        if not self.token_cache_path:
+            return False
+        try:
+            with open(self.token_cache_path, "rb") as f:
+                cached = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return False
+        if cached.get("client_id") != self.client_id:
+            return False
+        self._set_token(cached.get("access_token"), cached.get("expiry", 0.0))
+        return self._token_valid()
+    
+    def _save_cached_token(self):
+        """Write the token to the cache file, readable by the owner only."""
+        if not self.token_cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.token_cache_path) or ".", exist_ok=True)
+            tmp_path = f"{self.token_cache_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps({
+                    "client_id": self.client_id,
+                    "access_token": self.access_token,
+                    "expiry": self.token_expiry
+                }))
+            os.replace(tmp_path, self.token_cache_path)
+        except OSError as e:
+            print(f"⚠️  Could not cache eBay access token: {e}")
+    
+    def ensure_token(self) -> bool:
+        """
+        Make sure a valid access token is held, renewing it close to expiry.
         
+        Returns:
+            True if a valid token is available
+        """
+        if self._token_valid():
+            return True
+        with self._token_lock:
+            # Another thread may have renewed it while we waited
+            return self._token_valid() or self.get_access_token()
+    
     def get_access_token(self) -> bool:
-        """Get OAuth2 access token."""
+        """Get OAuth2 access token (reusing a cached one that is still valid)."""
+        if self._load_cached_token():
+            print("✓ Using cached eBay access token")
+            return True
+        
         try:
-            credentials = f"{self.client_id}:{self.client_secret}"
-            encoded_credentials = base64.b64encode(credentials.encode()).decode()
-            
-            headers = {
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Authorization": f"Basic {encoded_credentials}"
-            }
-            data = {
-                "grant_type": "client_credentials",
-                "scope": "https://api.ebay.com/oauth/api_scope"
-            }
-            
-            response = requests.post(self.token_url, headers=headers, data=data)
+            response = self.session.post(self.token_url, headers=self._token_headers, data=self._token_body)
             response.raise_for_status()
             
-            token_data = response.json()
-            self.access_token = token_data.get("access_token")
+            token_data = orjson.loads(response.content)
+            self._set_token(token_data.get("access_token"), time.time() + token_data.get("expires_in", 7200))
             
             if self.access_token:
                 print("✓ Successfully obtained eBay access token")
+                self._save_cached_token()
                 return True
             else:
                 print("✗ Failed to obtain eBay access token")
@@ -79,35 +246,78 @@ class eBaySearch:
             if hasattr(e.response, 'text'):
                 print(f"Response: {e.response.text}")
             return False
+        except orjson.JSONDecodeError as e:
+            print(f"✗ Invalid eBay token response: {e}")
+            return False
     
     def search_items(self, query: str, limit: int = 4) -> Optional[Dict]:
         """Search for items on eBay."""
-        if not self.access_token:
-            print("✗ No eBay access token. Please authenticate first.")
+        if not self.ensure_token():
+            print("✗ No eBay access token. Please check your credentials.")
             return None
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.access_token}",
-                "X-EBAY-C-MARKETPLACE-ID": "EBAY_US",
-                "Content-Type": "application/json"
-            }
             params = {
                 "q": query,
                 "limit": min(max(limit, 1), 200)
             }
             
-            url = f"{self.base_url}{self.search_endpoint}"
-            response = requests.get(url, headers=headers, params=params)
+            with self._slots:
+                response = self.session.get(self._search_url, headers=self._search_headers, params=params)
             response.raise_for_status()
             
-            return response.json()
+            # orjson parses the raw bytes directly (several times faster than the stdlib)
+            return orjson.loads(response.content)
             
         except requests.exceptions.RequestException as e:
             print(f"✗ Error searching eBay: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"Response: {e.response.text}")
             return None
+        except orjson.JSONDecodeError as e:
+            print(f"✗ Invalid eBay search response: {e}")
+            return None
+    
+    async def search_items_async(self, query: str, client: httpx.AsyncClient, limit: int = 4) -> Optional[Dict]:
+        """
+        Search for items on eBay without blocking the event loop.
+        
+        Args:
+            query: Search term
+            client: Shared httpx.AsyncClient (keep-alive connection pool)
+            limit: Number of items to return
+        """
+        # Renewing the token is rare (about every two hours) and stays on requests
+        if not self._token_valid() and not await asyncio.to_thread(self.ensure_token):
+            print("✗ No eBay access token. Please check your credentials.")
+            return None
+        
+        params = {
+            "q": query,
+            "limit": min(max(limit, 1), 200)
+        }
+        
+        try:
+            async with self._async_slots:
+                response = await request_with_retries(client, "GET", self._search_url, headers=self._search_headers, params=params)
+            response.raise_for_status()
+            return orjson.loads(response.content)
+            
+        except httpx.HTTPStatusError as e:
+            print(f"✗ Error searching eBay: {e}")
+            print(f"Response: {e.response.text}")
+            return None
+        except httpx.HTTPError as e:
+            print(f"✗ Error searching eBay: {e}")
+            return None
+        except orjson.JSONDecodeError as e:
+            print(f"✗ Invalid eBay search response: {e}")
+            return None
+    
+    def close(self):
+        """Close the connection pool (unless it is a shared session)."""
+        if self._owns_session:
+            self.session.close()
     
     def display_results(self, results: Dict):
         """Display eBay search results."""
@@ -121,10 +331,10 @@ class eBaySearch:
         # We only display the top 4 (or fewer)
         results_to_display = item_summaries[:4]
         
-        print(f"\n{'='*80}")
+        print(f"\n{RULE}")
         print(f"Found {total} item(s) on eBay")
         print(f"Displaying {len(results_to_display)} result(s):")
-        print(f"{'='*80}\n")
+        print(f"{RULE}\n")
         
         if not results_to_display:
             print("No eBay items found matching your search criteria.")
@@ -138,11 +348,14 @@ class eBaySearch:
             condition = item.get("condition", "N/A")
             item_web_url = item.get("itemWebUrl", "N/A")
             
-            print(f"{idx}. {title}")
-            print(f"   Price: {price_value} {price_currency}")
-            print(f"   Condition: {condition}")
-            print(f"   URL: {item_web_url}")
-            print(f"   {'-'*78}")
+            # One print per item (each print call takes the stdout lock)
+            print(
+                f"{idx}. {title}\n"
+                f"   Price: {price_value} {price_currency}\n"
+                f"   Condition: {condition}\n"
+                f"   URL: {item_web_url}\n"
+                f"   {ITEM_RULE}"
+            )
 
 # ==============================================================================
 # NEW AmazonSearch CLASS
@@ -153,13 +366,57 @@ class eBaySearch:
 class RainforestSearch:
     """Class to handle Rainforest API (Amazon) searches."""
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        session: Optional[requests.Session] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        """
+        Initialize Rainforest Search.
+        
+        Args:
+            api_key: Rainforest API key
+            session: Optional shared requests.Session (keep-alive connection pool)
+            max_concurrency: Most searches sent to Rainforest at once
+        """
         self.api_key = api_key
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = asyncio.Semaphore(max_concurrency)  # Same cap for search_items_async
+        self._owns_session = session is None
+        self.session = session or create_http_session()
         self.base_url = "https://api.rainforestapi.com/request"
+    
+    def close(self):
+        """Close the connection pool (unless it is a shared session)."""
+        if self._owns_session:
+            self.session.close()
+        
+    @staticmethod
+    def _stream_top_results(response: requests.Response, top_n: int) -> Dict:
+        """
+        Parse only the first top_n entries of search_results from a streamed response.
         
-    def search_items(self, query: str) -> Optional[Dict]:
+        The rest of the body is read without being parsed, so the connection
+        goes back to the pool instead of being dropped.
+        """
+        response.raw.decode_content = True  # Let urllib3 undo gzip
+        try:
+            items = list(islice(ijson.items(response.raw, "search_results.item", use_float=True), top_n))
+        finally:
+            for _ in response.iter_content(64 * 1024):
+                pass
+        return {"search_results": items}
+    
+    def search_items(self, query: str, top_n: Optional[int] = None) -> Optional[Dict]:
         """
         Search for items on Amazon using Rainforest API.
+        
+        Args:
+            query: Search term
+            top_n: Keep only the first top_n search_results (None keeps the full
+                response). With ijson installed, large responses are then only
+                parsed up to those results and the other keys are dropped.
         """
         if not self.api_key:
             print("✗ Error: RAINFOREST_API_KEY not found in .env file.")
@@ -175,18 +432,74 @@ class RainforestSearch:
         
         print(f"\nSearching Amazon (via Rainforest) for: '{query}'...")
         
+        stream = top_n is not None and ijson is not None
         try:
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status() # Raises an error for bad responses (4xx or 5xx)
+            with self._slots:
+                response = self.session.get(self.base_url, params=params, stream=stream)
+                response.raise_for_status() # Raises an error for bad responses (4xx or 5xx)
+                
+                if stream and int(response.headers.get("Content-Length", STREAM_MIN_BYTES)) >= STREAM_MIN_BYTES:
+                    return self._stream_top_results(response, top_n)
+                
+                # Return the JSON response (Rainforest payloads run to hundreds of KB,
+                # so orjson's parse of the raw bytes matters here)
+                data = orjson.loads(response.content)
             
-            # Return the JSON response
-            return response.json() 
+            if top_n is not None and isinstance(data.get("search_results"), list):
+                data["search_results"] = data["search_results"][:top_n]
+            return data
             
         except requests.exceptions.RequestException as e:
             print(f"✗ Error searching Amazon (Rainforest): {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"Response: {e.response.text[:500]}...")
             return None
+        except ValueError as e:  # orjson and ijson parse errors
+            print(f"✗ Invalid Amazon (Rainforest) response: {e}")
+            return None
+    
+    async def search_items_async(self, query: str, client: httpx.AsyncClient, top_n: Optional[int] = None) -> Optional[Dict]:
+        """
+        Search for items on Amazon without blocking the event loop.
+        
+        Args:
+            query: Search term
+            client: Shared httpx.AsyncClient (keep-alive connection pool)
+            top_n: Keep only the first top_n search_results (None keeps the full response)
+        """
+        if not self.api_key:
+            print("✗ Error: RAINFOREST_API_KEY not found in .env file.")
+            return None
+        
+        params = {
+            "api_key": self.api_key,
+            "type": "search",
+            "amazon_domain": "amazon.com",
+            "search_term": query
+        }
+        
+        print(f"\nSearching Amazon (via Rainforest) for: '{query}'...")
+        
+        try:
+            async with self._async_slots:
+                response = await request_with_retries(client, "GET", self.base_url, params=params)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+            
+            if top_n is not None and isinstance(data.get("search_results"), list):
+                data["search_results"] = data["search_results"][:top_n]
+            return data
+            
+        except httpx.HTTPStatusError as e:
+            print(f"✗ Error searching Amazon (Rainforest): {e}")
+            print(f"Response: {e.response.text[:500]}...")
+            return None
+        except httpx.HTTPError as e:
+            print(f"✗ Error searching Amazon (Rainforest): {e}")
+            return None
+        except orjson.JSONDecodeError as e:
+            print(f"✗ Invalid Amazon (Rainforest) response: {e}")
+            return None
 # ==============================================================================
 # NEW Amazon Display Function
 # ==============================================================================
@@ -257,10 +570,10 @@ def display_rainforest_results(results: Dict):
     # Slice to get max 4 results
     results_to_display = search_results[:4]
     
-    print(f"\n{'='*80}")
+    print(f"\n{RULE}")
     print(f"Found {len(search_results)} item(s) on Amazon (via Rainforest)")
     print(f"Displaying {len(results_to_display)} result(s):")
-    print(f"{'='*80}\n")
+    print(f"{RULE}\n")
     
     if not results_to_display:
         print("No Amazon items found matching your search criteria.")
@@ -275,11 +588,14 @@ def display_rainforest_results(results: Dict):
         ratings_total = item.get("ratings_total", 0)
         # --- End of keys ---
         
-        print(f"{idx}. {title}")
-        print(f"   Price: {price}")
-        print(f"   Rating: {rating} stars ({ratings_total} reviews)")
-        print(f"   URL: {link}")
-        print(f"   {'-'*78}")
+        # One print per item (each print call takes the stdout lock)
+        print(
+            f"{idx}. {title}\n"
+            f"   Price: {price}\n"
+            f"   Rating: {rating} stars ({ratings_total} reviews)\n"
+            f"   URL: {link}\n"
+            f"   {ITEM_RULE}"
+        )
 
 # ==============================================================================
 # UPDATED main() Function
@@ -315,6 +631,8 @@ def display_rainforest_results(results: Dict):
 #         return
         
 #     try:
+#         # Imported here: the search classes don't need the openai SDK
+#         from openai import OpenAI
 #         # This is the new OpenAI client, configured for OpenRouter
 #         client = OpenAI(
 #             base_url="https://openrouter.ai/api/v1",
@@ -5,17 +5,28 @@ Connects the frontend to the search logic.
 """
 
 import os
+import asyncio
 import uvicorn
+import httpx
 from datetime import datetime
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from types import MappingProxyType
 
 from fastapi import FastAPI
+from fastapi.responses import Response, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional
-from openai import OpenAI
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import List, Dict, Optional, Annotated
+from openai import AsyncOpenAI
 
 # Import agent classes from the agents package
 from agents import eBaySearch, RainforestSearch, ResearchAgent
+from agents.search_agents import create_http_session
+from agents.research_agent import VERIFICATION_CACHE_TTL
+from cache_backend import create_cache_backend, SharedTTLCache
+from response_cache import LLMCache
 
 # --- Load API Keys ---
 from dotenv import load_dotenv
@@ -28,51 +39,99 @@ RAINFOREST_API_KEY = os.environ.get("RAINFOREST_API_KEY")
 SERPER_API_KEY = os.environ.get("SERPER_API_KEY")
 
 # --- Initialize the App ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release pooled connections on shutdown."""
+    yield
+    http_session.close()
+    await ai_client.close()
+    if research_agent:
+        await research_agent.aclose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)  # orjson for every JSON response
 
 # --- Add CORS Middleware ---
 # This is CRITICAL to allow your frontend (on a different port)
 # to talk to this backend.
+# Explicit origins (comma-separated CORS_ORIGINS; defaults to the Vite dev server)
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get(
+        "CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173"
+    ).split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], # Allows all origins (for development)
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"], # Allows all methods
-    allow_headers=["*"], # Allows all headers
+    allow_methods=["POST", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Browsers cache preflight responses for a day
 )
 
+# --- Compress Larger Responses ---
+# The /chat results payload (up to 8 products) shrinks several-fold with gzip;
+# level 5 keeps the CPU cost low, and bodies under 1 KB are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # --- Initialize API Clients (Globally) ---
 # This is efficient. We do it once on startup, not on every request.
+
+# One keep-alive connection pool shared by eBay, Rainforest and Serper, so repeat
+# calls skip the TCP+TLS handshake. The agents are blocking and run on worker
+# threads, so the pool is sized for concurrent requests per host.
+http_session = create_http_session(pool_maxsize=32)
+
+# Persistent store behind the verification, search and AI reply caches, so
+# reloads and worker restarts keep their hit rate (see cache_backend.py)
+cache_backend = create_cache_backend()
+
 print("Authenticating with eBay API...")
-ebay = eBaySearch(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET)
+ebay = eBaySearch(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET, session=http_session)
 ebay.get_access_token()
 
 print("Initializing Rainforest API...")
-amazon = RainforestSearch(RAINFOREST_API_KEY)
+amazon = RainforestSearch(RAINFOREST_API_KEY, session=http_session)
 
 print("Initializing OpenRouter AI...")
-ai_client = OpenAI(
+ai_client = AsyncOpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=OPENROUTER_API_KEY,
     default_headers={
         "HTTP-Referer": "http://localhost",
         "X-Title": "eBay-Amazon-Search"
     },
+    # Short timeouts with bounded retries keep /chat tail latency in check when OpenRouter stalls
+    timeout=httpx.Timeout(connect=2.0, read=20.0, write=20.0, pool=2.0),
+    max_retries=2,
 )
 
 # Initialize Research Agent (optional - only if API key is provided)
 research_agent = None
 if SERPER_API_KEY:
     print("Initializing Research Agent with web search...")
-    research_agent = ResearchAgent(OPENROUTER_API_KEY, SERPER_API_KEY)
+    research_agent = ResearchAgent(
+        OPENROUTER_API_KEY,
+        SERPER_API_KEY,
+        session=http_session,
+        verification_cache=SharedTTLCache("research", VERIFICATION_CACHE_TTL, backend=cache_backend)
+    )
 else:
     print("⚠️  SERPER_API_KEY not found - Research Agent disabled")
     print("   Get a free key at https://serper.dev for product verification")
 
 # --- Define Request/Response Models ---
+# Request size limits; oversized payloads are rejected by pydantic before reaching the AI
+MAX_MESSAGE_CHARS = 4000
+MAX_HISTORY_MESSAGES = 100
+
 class ChatRequest(BaseModel):
-    message: str
-    history: List[Dict[str, str]]
+    model_config = ConfigDict(strict=True, extra="ignore")
+
+    message: Annotated[str, Field(max_length=MAX_MESSAGE_CHARS)]
+    history: Annotated[List[Dict[str, str]], Field(max_length=MAX_HISTORY_MESSAGES)]
 
 class ChatResponse(BaseModel):
     type: str
@@ -80,68 +139,248 @@ class ChatResponse(BaseModel):
     history: List[Dict[str, str]]
     results: Optional[Dict] = None
 
-# --- API Endpoint ---
+# Serializer for server-built ChatResponse objects. Handlers construct responses
+# from trusted data, so they skip validation and are dumped straight to JSON.
+_CHAT_RESPONSE_ADAPTER = TypeAdapter(ChatResponse)
+
+def chat_json_response(**fields) -> Response:
+    """Build a ChatResponse without re-validating it and return it as raw JSON."""
+    chat_response = ChatResponse.model_construct(**fields)
+    return Response(
+        content=_CHAT_RESPONSE_ADAPTER.dump_json(chat_response),
+        media_type="application/json"
+    )
+
+# --- Prompts ---
+# Built once at import; only the date changes between requests.
+SYSTEM_PROMPT_TEMPLATE = (
+    "You are a helpful search assistant for eBay and Amazon. Today's date is {current_date}. "
+    "Your goal is to ask the user 1-2 follow-up questions to get key details "
+    "(like model, color, size, condition, storage, or budget) to refine their search. "
+    "Once you have enough details, your *very last* message must ONLY be the "
+    "final search query, prefixed with 'FINAL_QUERY:'. "
+    "For example: 'FINAL_QUERY: iPhone 15 Pro Max 256GB new'. "
+    "IMPORTANT: Do not make assumptions about product availability. If a user asks for a product, "
+    "assume it exists and help them search for it. Focus on gathering search details, not questioning whether products exist."
+)
+WELCOME_MESSAGE = "Greetings, I will help you find the best deals on eBay and Amazon. What are you looking for today?"
+
+@lru_cache(maxsize=1)
+def _get_system_prompt(current_date: str) -> str:
+    """Render the system prompt; cached so it is only rebuilt when the date changes."""
+    return SYSTEM_PROMPT_TEMPLATE.format(current_date=current_date)
+
+@lru_cache(maxsize=1)
+def _get_welcome_body(current_date: str) -> bytes:
+    """Serialize the welcome ChatResponse; identical for every client on a given day."""
+    welcome = ChatResponse.model_construct(
+        type="question",
+        message=WELCOME_MESSAGE,
+        history=[
+            {"role": "system", "content": _get_system_prompt(current_date)},
+            {"role": "assistant", "content": WELCOME_MESSAGE}
+        ]
+    )
+    return _CHAT_RESPONSE_ADAPTER.dump_json(welcome)
+
+# Only the most recent turns are sent to the model; older turns add tokens
+# (and latency) without helping it narrow down the current search.
+MAX_PROMPT_MESSAGES = 40
+
+def _prompt_window(history: List[Dict[str, str]]) -> List[Dict]:
+    """
+    Return the messages to send to the model: the leading system prompt plus recent turns.
+
+    The system prompt is sent as a content part with an OpenRouter cache_control
+    breakpoint, so providers that support prompt caching (Gemini, Anthropic)
+    reuse it instead of reprocessing it on every turn.
+    """
+    if not history or history[0].get("role") != "system":
+        return history[-MAX_PROMPT_MESSAGES:]
+    system = history[0]
+    if isinstance(system.get("content"), str):
+        system = {"role": "system", "content": [
+            {"type": "text", "text": system["content"], "cache_control": {"type": "ephemeral"}}
+        ]}
+    return [system, *history[1:][-MAX_PROMPT_MESSAGES:]]
+
+# Shared read-only stand-in for missing nested objects in search payloads
+_EMPTY = MappingProxyType({})
+
+# Parsed search results are cached briefly; identical final queries are common
+SEARCH_CACHE_TTL = 300  # 5 minutes - listings and prices move quickly
+search_cache = SharedTTLCache("search", SEARCH_CACHE_TTL, maxsize=512, backend=cache_backend)
+
+async def run_product_search(final_query: str) -> Dict[str, List[Dict]]:
+    """
+    Search eBay and Amazon concurrently and parse the top results.
+
+    Both clients are blocking, so they run on worker threads to overlap the round-trips.
+
+    Args:
+        final_query: The final search query from the AI
+
+    Returns:
+        Dict with "ebay" and "amazon" result lists (empty for a failed search)
+    """
+    key = " ".join(final_query.lower().split())
+    cached = await search_cache.aget(key)
+    if cached is not None:
+        print(f"⚡ Search cache hit: {key}")
+        return cached
+
+    print(f"🔎 Searching eBay and Amazon for: {final_query}")
+    ebay_data, amazon_data = await asyncio.gather(
+        asyncio.to_thread(ebay.search_items, final_query, limit=4),
+        asyncio.to_thread(amazon.search_items, final_query, top_n=4),
+        return_exceptions=True
+    )
+    if isinstance(ebay_data, Exception):
+        print(f"⚠️  eBay search error: {ebay_data}")
+        ebay_data = None
+    if isinstance(amazon_data, Exception):
+        print(f"⚠️  Amazon search error: {amazon_data}")
+        amazon_data = None
+
+    # --- Parse eBay Results ---
+    ebay_results = []
+    if ebay_data and "itemSummaries" in ebay_data:
+        ebay_results = [
+            {
+                "title": item.get("title"),
+                "price": f"{(price := item.get('price') or _EMPTY).get('value')} {price.get('currency')}",
+                "condition": item.get("condition"),
+                "url": item.get("itemWebUrl"),
+                "image_url": (item.get("image") or _EMPTY).get("imageUrl")
+            }
+            for item in ebay_data["itemSummaries"][:4]
+        ]
+        print(f"✓ Found {len(ebay_results)} eBay results")
+    else:
+        print(f"⚠️  eBay search returned no results or error: {ebay_data}")
+
+    # --- Parse Amazon (Rainforest) Results ---
+    amazon_results = []
+    if amazon_data and "search_results" in amazon_data:
+        amazon_results = [
+            {
+                "title": item.get("title"),
+                "price": (item.get("price") or _EMPTY).get("raw"),
+                "rating": f"{item.get('rating')} stars ({item.get('ratings_total')} reviews)",
+                "url": item.get("link"),
+                "image_url": item.get("image")
+            }
+            for item in amazon_data["search_results"][:4]
+        ]
+
+    results = {"ebay": ebay_results, "amazon": amazon_results}
+    # Both clients return None on errors; only cache when both searches answered
+    if ebay_data is not None and amazon_data is not None:
+        await search_cache.aset(key, results)
+    return results
+
+AI_MODEL = "google/gemini-2.5-flash-lite"
+FINAL_QUERY_MARKER = "FINAL_QUERY:"
+
+# Exact-match cache of AI replies (api.py has no embedding service for the semantic tier)
+llm_cache = LLMCache(backend=cache_backend)
+
+async def stream_ai_reply(messages: List[Dict[str, str]], on_final_query=None) -> str:
+    """
+    Stream a completion from OpenRouter and return the full reply.
+
+    Args:
+        messages: Messages to send to the model
+        on_final_query: Optional callback, invoked once with the query as soon as
+            a complete FINAL_QUERY line has streamed in (before the reply ends)
+
+    Returns:
+        The reply text, stripped. Generation is cut off once a complete
+        FINAL_QUERY line has arrived, since anything after it is unused.
+    """
+    stream = await ai_client.chat.completions.create(
+        model=AI_MODEL,
+        messages=messages,
+        stream=True
+    )
+    reply = ""
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        reply += delta
+        if reply.startswith(FINAL_QUERY_MARKER):
+            line_end = reply.find("\n")
+            if line_end != -1:
+                query = reply[len(FINAL_QUERY_MARKER):line_end].strip()
+                if query:
+                    if on_final_query is not None:
+                        on_final_query(query)
+                    reply = reply[:line_end]
+                    await stream.close()  # Stop generating (and paying for) trailing text
+                    break
+    return reply.strip()
+
 # --- API Endpoint ---
 @app.post("/chat", response_model=ChatResponse)
 async def handle_chat(request: ChatRequest):
     
-    # 1. Define prompts
+    # 1. The prompt and welcome body are rendered once per day (see _get_system_prompt)
     current_date = datetime.now().strftime("%B %d, %Y")
     
-    system_prompt = (
-        f"You are a helpful search assistant for eBay and Amazon. Today's date is {current_date}. "
-        "Your goal is to ask the user 1-2 follow-up questions to get key details "
-        "(like model, color, size, condition, storage, or budget) to refine their search. "
-        "Once you have enough details, your *very last* message must ONLY be the "
-        "final search query, prefixed with 'FINAL_QUERY:'. "
-        "For example: 'FINAL_QUERY: iPhone 15 Pro Max 256GB new'. "
-        "IMPORTANT: Do not make assumptions about product availability. If a user asks for a product, "
-        "assume it exists and help them search for it. Focus on gathering search details, not questioning whether products exist."
-    )
-    welcome_message = "Greetings, I will help you find the best deals on eBay and Amazon. What are you looking for today?"
-    
     # --- 2. NEW FIX: Handle the initial "hello" from the frontend ---
     if not request.message and not request.history:
         print("INFO: Sending initial welcome message to frontend.")
-        return ChatResponse(
-            type="question",
-            message=welcome_message,
-            history=[
-                {"role": "system", "content": system_prompt},
-                {"role": "assistant", "content": welcome_message}
-            ]
-        )
+        return Response(content=_get_welcome_body(current_date), media_type="application/json")
     # --- End of new fix ---
 
     # 3. Prepare Chat History for a real message
-    chat_history = request.history
-    chat_history.append({"role": "user", "content": request.message})
+    chat_history = [*request.history, {"role": "user", "content": request.message}]
     
-    # 4. Call AI
+    # 4. Call AI, starting the searches as soon as a complete FINAL_QUERY line streams in
+    search_task = None
+    early_query = None
+
+    def start_search(query: str):
+        nonlocal search_task, early_query
+        early_query = query
+        search_task = asyncio.create_task(run_product_search(query))
+
     try:
-        response = ai_client.chat.completions.create(
-            model="google/gemini-2.5-flash-lite",  # Upgraded from flash-lite for better accuracy
-            messages=chat_history
-        )
-        ai_message = response.choices[0].message.content.strip()
+        messages_for_ai = _prompt_window(chat_history)
+        ai_message, cache_token = await llm_cache.lookup(AI_MODEL, messages_for_ai)
+        if ai_message is None:
+            ai_message = await stream_ai_reply(messages_for_ai, on_final_query=start_search)
+            await llm_cache.store(cache_token, ai_message)
         chat_history.append({"role": "assistant", "content": ai_message})
         
     except Exception as e:
+        if search_task:
+            search_task.cancel()
         print(f"✗ Error communicating with OpenRouter: {e}")
-        return ChatResponse(
+        return chat_json_response(
             type="question",
             message="Sorry, I had an error connecting to the AI. Please try again.",
             history=chat_history
         )
 
     # 5. Check Response Type
-    if ai_message.startswith("FINAL_QUERY:"):
-        final_query = ai_message.replace("FINAL_QUERY:", "").strip()
+    if ai_message.startswith(FINAL_QUERY_MARKER):
+        final_query = ai_message.removeprefix(FINAL_QUERY_MARKER).strip()
+
+        # The early search only counts if it used the final query (run it now otherwise,
+        # so it overlaps with verification)
+        if early_query != final_query:
+            if search_task:
+                search_task.cancel()
+            start_search(final_query)
         
         # --- RESEARCH AGENT: Verify product exists before searching ---
         if research_agent:
             print(f"🔍 Research Agent: Verifying '{final_query}' before searching...")
-            verification = research_agent.verify_product(final_query)
+            verification = await asyncio.to_thread(research_agent.verify_product, final_query)
             
             release_status = verification.get('release_status', 'unknown')
             print(f"   Release Status: {release_status}")
@@ -158,7 +397,8 @@ async def handle_chat(request: ChatRequest):
                 else:
                     message = f"I couldn't find reliable information about '{final_query}'. {verification['info']} Would you like to search for something else?"
                 
-                return ChatResponse(
+                search_task.cancel()
+                return chat_json_response(
                     type="question",
                     message=message,
                     history=chat_history
@@ -166,49 +406,19 @@ async def handle_chat(request: ChatRequest):
             else:
                 print(f"✓ Product verified: {verification['info']}")
         
-        # --- A. It's a Final Query: Run searches ---
-        print(f"🔎 Searching eBay and Amazon for: {final_query}")
-        ebay_data = ebay.search_items(final_query, limit=4)
-        amazon_data = amazon.search_items(final_query)
-        
-        # --- Parse eBay Results ---
-        ebay_results = []
-        if ebay_data and "itemSummaries" in ebay_data:
-            for item in ebay_data["itemSummaries"][:4]:
-                ebay_results.append({
-                    "title": item.get("title"),
-                    "price": f"{item.get('price', {}).get('value')} {item.get('price', {}).get('currency')}",
-                    "condition": item.get("condition"),
-                    "url": item.get("itemWebUrl"),
-                    "image_url": item.get("image", {}).get("imageUrl")
-                })
-            print(f"✓ Found {len(ebay_results)} eBay results")
-        else:
-            print(f"⚠️  eBay search returned no results or error: {ebay_data}")
-            ebay_results = []
-        
-        # --- Parse Amazon (Rainforest) Results ---
-        amazon_results = []
-        if amazon_data and "search_results" in amazon_data:
-            for item in amazon_data["search_results"][:4]:
-                amazon_results.append({
-                    "title": item.get("title"),
-                    "price": item.get("price", {}).get("raw"),
-                    "rating": f"{item.get('rating')} stars ({item.get('ratings_total')} reviews)",
-                    "url": item.get("link"),
-                    "image_url": item.get("image")
-                })
-
-        return ChatResponse(
+        # --- A. It's a Final Query: Collect the searches started above ---
+        results = await search_task
+
+        return chat_json_response(
             type="results",
             message=f"Great! I will search both eBay and Amazon for: '{final_query}'",
             history=chat_history,
-            results={"ebay": ebay_results, "amazon": amazon_results}
+            results=results
         )
         
     else:
         # --- B. It's a Follow-up Question ---
-        return ChatResponse(
+        return chat_json_response(
             type="question",
             message=ai_message,
             history=chat_history
@@ -216,5 +426,16 @@ async def handle_chat(request: ChatRequest):
 # --- Uvicorn server startup (for running this file directly) ---
 if __name__ == "__main__":
     
+    # Multiple workers with uvloop/httptools by default; DEV=1 runs a single auto-reloading worker
+    dev_mode = os.getenv("DEV", "0") == "1"
     print("Starting backend API server at http://127.0.0.1:8000")
-    uvicorn.run("api:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(
+        "api:app",
+        host="127.0.0.1",
+        port=8000,
+        reload=dev_mode,
+        workers=None if dev_mode else int(os.getenv("WEB_CONCURRENCY", "4")),
+        loop="uvloop",
+        http="httptools",
+        ws="none"  # Pure HTTP API; skip loading a WebSocket implementation
+    )
\ No newline at end of file
@@ -6,35 +6,77 @@ Includes User Authentication and SQLite Persistence
 """
 
 import os
+import re
+import logging
+import hashlib
+import io
+import base64
+import time
+import asyncio
 import uvicorn
 import httpx
-from datetime import datetime, timedelta
+import orjson
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile
-from fastapi.responses import Response
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, status, File, UploadFile
+from fastapi.responses import Response, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
-from openai import OpenAI
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import List, Dict, Optional, Any, Annotated, Awaitable, Callable, Literal
+from openai import AsyncOpenAI
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 
+# Pillow is optional: without it, uploaded images are forwarded unchanged
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
 # Load API Keys
 from dotenv import load_dotenv
 load_dotenv()
 
+# Per-request progress is logged at DEBUG (set LOG_LEVEL=DEBUG to see it); the
+# default INFO level keeps warnings, errors and blocked products
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+logger = logging.getLogger("api_mcp")
+
 # Import Auth & DB
 import models
 import auth
 from database import engine, get_db
 from database import engine, get_db
 from embeddings import EmbeddingService
+from cache_backend import create_cache_backend, SharedTTLCache
+from response_cache import LLMCache
 from a2ui_models import A2UIMessage, Card, ListComponent, Image, Button, Text, Box
 from a2ui_models import A2UIMessage, Card, ListComponent, Image, Button, Text, Box
 
 # Create Tables
 models.Base.metadata.create_all(bind=engine)
 
+# create_all doesn't add columns to an existing table; an app.db from before a
+# column was added needs its one-shot migration. Fail here with the fix rather
+# than on the first query that touches chats.
+CHAT_COLUMN_MIGRATIONS = {
+    "image_data": "migrate_add_image.py",
+    "results_z": "migrate_compress_results.py",
+}
+_chat_columns = {column["name"] for column in inspect(engine).get_columns("chats")}
+_missing_migrations = [
+    script for column, script in CHAT_COLUMN_MIGRATIONS.items() if column not in _chat_columns
+]
+if _missing_migrations:
+    raise RuntimeError(
+        "app.db needs migrating; run: "
+        + " && ".join(f"python3 {script}" for script in _missing_migrations)
+    )
+
 OPENROUTER_API_KEY = os.environ.get("MAIN_AGENT_API_KEY") or os.environ.get("OPENROUTER_API_KEY")
 
 # MCP Server URLs
@@ -42,32 +84,142 @@ RESEARCH_AGENT_URL = "http://127.0.0.1:8001"
 EBAY_AGENT_URL = "http://127.0.0.1:8002"
 AMAZON_AGENT_URL = "http://127.0.0.1:8003"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release pooled connections (MCP calls and OpenRouter, try-on image API) on shutdown."""
+    yield
+    await http_client.aclose()
+    await nano_banana_client.aclose()
+
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)  # orjson for every JSON response
 
 # Add CORS Middleware
+# Explicit origins (comma-separated CORS_ORIGINS; defaults to the Vite dev server)
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get(
+        "CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173"
+    ).split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Browsers cache preflight responses for a day
+)
+
+# Compress larger JSON bodies (e.g. /chat results and conversation histories); level 5
+# trades a little ratio for much less CPU than the default 9. Bodies under 1 KB
+# (auth, short replies) gain little and are sent as-is.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# HTTP client for MCP servers (also carries the OpenRouter traffic)
+# Pooled keep-alive connections; HTTP/2 is negotiated for HTTPS hosts such as OpenRouter
+# (the transport also retries a failed connect once; requests are never re-sent)
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(connect=3.0, read=30.0, write=10.0, pool=5.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0),
+        retries=1
+    )
 )
 
+# --- MCP Calls ---
+# The MCP servers run locally, so a slow answer means trouble: fail fast rather
+# than hold /chat for the client-wide 30s, and stop calling a server that keeps failing
+MCP_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an MCP server whose circuit breaker is open."""
+
+class CircuitBreaker:
+    """
+    Trips after max_failures consecutive failures; while open, calls fail
+    immediately. After reset_timeout seconds calls are let through again, and
+    the next failure re-opens the circuit.
+    """
+
+    def __init__(self, name: str, max_failures: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def before_call(self):
+        if self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout:
+            raise CircuitOpenError(f"{self.name} unavailable (circuit open)")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            if self.opened_at is None:
+                logger.warning("⚠️  %s: %d consecutive failures, pausing calls for %.0fs", self.name, self.failures, self.reset_timeout)
+            self.opened_at = time.monotonic()
+
+mcp_breakers = {
+    RESEARCH_AGENT_URL: CircuitBreaker("Research Agent"),
+    EBAY_AGENT_URL: CircuitBreaker("eBay Agent"),
+    AMAZON_AGENT_URL: CircuitBreaker("Amazon Agent"),
+}
+
+async def mcp_post(base_url: str, path: str, payload: Dict) -> httpx.Response:
+    """
+    POST to an MCP server with a short timeout, guarded by its circuit breaker.
+
+    Args:
+        base_url: MCP server URL (one of the *_AGENT_URL constants)
+        path: Endpoint path, e.g. "/search"
+        payload: JSON body
+
+    Returns:
+        The response (status not checked). Raises CircuitOpenError while the
+        server's circuit is open, httpx.RequestError on transport errors.
+    """
+    breaker = mcp_breakers[base_url]
+    breaker.before_call()
+    try:
+        response = await http_client.post(
+            f"{base_url}{path}",
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"},
+            timeout=MCP_TIMEOUT
+        )
+    except httpx.RequestError:
+        breaker.record_failure()
+        raise
+    # 4xx means a bad request, not an unhealthy server
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
 # Initialize OpenRouter AI
+# Short timeouts with bounded retries keep /chat tail latency in check when OpenRouter stalls
 print("Initializing OpenRouter AI for main agent...")
-ai_client = OpenAI(
+ai_client = AsyncOpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=OPENROUTER_API_KEY,
     default_headers={
         "HTTP-Referer": "http://localhost",
         "X-Title": "Shopping-Assistant-MCP"
     },
+    timeout=httpx.Timeout(connect=2.0, read=20.0, write=20.0, pool=2.0),
+    max_retries=2,
+    http_client=http_client,
 )
 
-# HTTP client for MCP servers
-http_client = httpx.AsyncClient(timeout=30.0)
-
 # Initialize RAG Embedding Service
 print("Initializing RAG Embedding Service...")
 try:
@@ -77,6 +229,368 @@ except Exception as e:
     print(f"⚠️  RAG Embedding Service failed to initialize: {e}")
     embedding_service = None
 
+# Persistent store behind every cache below (Redis or SQLite; see cache_backend.py),
+# so reloads and worker restarts keep their hit rate and workers share entries
+cache_backend = create_cache_backend()
+
+# Prefix of the AI reply line that carries the search query
+FINAL_QUERY_MARKER = "FINAL_QUERY:"
+
+# Cache of AI replies; near-identical messages in the same conversation context
+# reuse the previous reply (semantic matching needs the embedding service).
+# Final queries are only reused for identical requests: a near-identical
+# message may name another variant, and the query decides what gets searched.
+llm_cache = LLMCache(
+    embed_fn=embedding_service.embed_text if embedding_service else None,
+    semantic_exclude=FINAL_QUERY_MARKER,
+    backend=cache_backend
+)
+
+# --- Result Caches ---
+# Identical final queries are common, so verification and search results are
+# cached. Only successful lookups are stored; errors always retry.
+SEARCH_CACHE_TTL = 300          # 5 minutes - listings and prices move quickly
+VERIFICATION_CACHE_TTL = 86400  # 24 hours - product existence changes slowly
+
+search_cache = SharedTTLCache("search", SEARCH_CACHE_TTL, backend=cache_backend)
+verification_cache = SharedTTLCache("verify", VERIFICATION_CACHE_TTL, backend=cache_backend)
+
+_QUERY_PUNCTUATION = str.maketrans("", "", ".,!?;:'\"")
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for use as a cache key (case, whitespace and punctuation insensitive)."""
+    return " ".join(query.lower().translate(_QUERY_PUNCTUATION).split())
+
+# RAG memory for a (user, message) pair: repeated or retried turns skip the
+# embedding call and the Pinecone query. Empty contexts are not cached, since
+# get_user_context also returns "" when Pinecone or the embedding call fails.
+RAG_CACHE_TTL = 300             # 5 minutes - new turns are added to memory constantly
+rag_cache = SharedTTLCache("rag", RAG_CACHE_TTL, backend=cache_backend)
+
+def rag_cache_key(user_id: int, message: str) -> str:
+    """Cache key for a user's RAG context lookup (message normalized, then hashed)."""
+    digest = hashlib.blake2b(normalize_query(message).encode(), digest_size=16).hexdigest()
+    return f"{user_id}:{digest}"
+
+# Lookups currently in flight, by cache key. Concurrent misses for the same key
+# (e.g. several users asking for the same product) share one MCP call.
+_inflight: Dict[str, asyncio.Task] = {}
+
+def _forget_inflight(key: str, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # Retrieved here in case every waiter was cancelled
+
+async def single_flight(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run fetch() at most once at a time per key; concurrent callers await the same task.
+
+    The shared task is shielded, so a caller that is cancelled (e.g. a discarded
+    prefetch) does not cancel it for the others; it still completes and fills the cache.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+    return await asyncio.shield(task)
+
+async def verify_product_cached(product_name: str) -> Dict:
+    """
+    Verify a product through the Research Agent, reusing recent verdicts.
+
+    Args:
+        product_name: Full product query (including the date)
+
+    Returns:
+        Verification dict from the Research Agent. Raises on HTTP/parse errors.
+    """
+    key = normalize_query(product_name)
+    cached = await verification_cache.aget(key)
+    if cached is not None:
+        logger.debug("⚡ Verification cache hit: %s", key)
+        return cached
+
+    return await single_flight(f"verify:{key}", lambda: _fetch_verification(product_name, key))
+
+async def _fetch_verification(product_name: str, key: str) -> Dict:
+    """Call the Research Agent and cache a confident verdict (see verify_product_cached)."""
+    research_response = await mcp_post(
+        RESEARCH_AGENT_URL, "/verify_product", {"product_name": product_name}
+    )
+    research_response.raise_for_status()
+    verification = orjson.loads(research_response.content)
+    # Low-confidence verdicts are often fallbacks for search/AI errors; retry those
+    if verification.get("confidence") in ("high", "medium"):
+        await verification_cache.aset(key, verification)
+    return verification
+
+async def search_products_cached(commerce_query: str) -> Dict[str, List]:
+    """
+    Search eBay and Amazon concurrently, reusing recent results for the same query.
+
+    Args:
+        commerce_query: Search query without the date suffix
+
+    Returns:
+        Dict with "ebay" and "amazon" result lists (empty on per-service errors)
+    """
+    key = normalize_query(commerce_query)
+    cached = await search_cache.aget(key)
+    if cached is not None:
+        logger.debug("⚡ Search cache hit: %s", key)
+        return cached
+
+    return await single_flight(f"search:{key}", lambda: _fetch_search_results(commerce_query, key))
+
+async def _fetch_search_results(commerce_query: str, key: str) -> Dict[str, List]:
+    """Query both marketplaces and cache the results if both answered (see search_products_cached)."""
+    # Search eBay and Amazon concurrently
+    ebay_response, amazon_response = await asyncio.gather(
+        mcp_post(EBAY_AGENT_URL, "/search", {"query": commerce_query, "limit": 4}),
+        mcp_post(AMAZON_AGENT_URL, "/search", {"query": commerce_query}),
+        return_exceptions=True
+    )
+
+    failed = False
+
+    ebay_results = []
+    try:
+        if isinstance(ebay_response, Exception):
+            raise ebay_response
+        ebay_response.raise_for_status()
+        ebay_data = orjson.loads(ebay_response.content)
+        ebay_results = ebay_data.get("results", [])
+        logger.debug("✓ Found %d eBay results (HTTP)", len(ebay_results))
+    except Exception as e:
+        failed = True
+        logger.warning("⚠️  eBay search error: %s", e)
+
+    amazon_results = []
+    try:
+        if isinstance(amazon_response, Exception):
+            raise amazon_response
+        amazon_response.raise_for_status()
+        amazon_data = orjson.loads(amazon_response.content)
+        amazon_results = amazon_data.get("results", [])
+        logger.debug("✓ Found %d Amazon results (HTTP)", len(amazon_results))
+    except Exception as e:
+        failed = True
+        logger.warning("⚠️  Amazon search error: %s", e)
+
+    results = {"ebay": ebay_results, "amazon": amazon_results}
+    if not failed:
+        await search_cache.aset(key, results)
+    return results
+
+async def get_rag_context_cached(user_id: int, message: str) -> str:
+    """
+    Retrieve RAG memory for a message (TTL-cached per user and normalized message)
+
+    The embedding call and Pinecone query are blocking, so they run on a worker
+    thread; process_chat starts this as a task and awaits it when building the prompt.
+
+    Args:
+        user_id: User ID
+        message: The user's message
+
+    Returns:
+        Formatted context from past conversations, or "" if none/unavailable
+    """
+    rag_key = rag_cache_key(user_id, message)
+    rag_context = await rag_cache.aget(rag_key, "")
+    if rag_context:
+        logger.debug("⚡ RAG context cache hit")
+        return rag_context
+
+    try:
+        rag_context = await asyncio.to_thread(
+            embedding_service.get_user_context,
+            user_id=user_id,
+            query=message,
+            top_k=3
+        )
+    except Exception as e:
+        logger.warning("⚠️  Failed to retrieve RAG context: %s", e)
+        return ""
+
+    if rag_context:
+        logger.debug("📚 RAG Context retrieved:\n%s", rag_context)
+        await rag_cache.aset(rag_key, rag_context)
+    return rag_context
+
+# --- Query Patterns ---
+# Compiled once at import instead of on every /chat request
+QUERY_DATE_RE = re.compile(r' on [A-Za-z]+ \d{1,2}, \d{4}', re.IGNORECASE)
+# Color and condition words that official product names don't contain
+COLOR_CONDITION_RE = re.compile(
+    r'\b(?:black|white|blue|red|green|yellow|orange|purple|pink|gray|grey|silver|gold|rose|titanium'
+    r'|new|used|refurbished|unlocked|sealed)\b',
+    re.IGNORECASE
+)
+
+# Storage capacity ("256GB", "1 TB") and model number ("15", "S24", "M3")
+# tokens of an already specific query
+CAPACITY_RE = re.compile(r'\b\d+\s?(?:GB|TB)\b', re.IGNORECASE)
+MODEL_NUMBER_RE = re.compile(r'\b[A-Za-z]*\d+[A-Za-z]*\b')
+# First-person and filler words of a request that still needs the AI
+# ("I need a new laptop for my 2 kids", "My budget is 500")
+CONVERSATIONAL_RE = re.compile(
+    r"\b(?:i|i'm|im|me|my|want|need|budget|looking|hi|hello|help)\b",
+    re.IGNORECASE
+)
+
+def strip_query_date(final_query: str) -> str:
+    """Remove the " on <Month> <Day>, <Year>" suffix that commerce sites don't need."""
+    return QUERY_DATE_RE.sub('', final_query).strip()
+
+def is_specific_product_query(message: str, history: List[Dict[str, Any]]) -> bool:
+    """
+    Whether an opening message already names a concrete product to search for
+    
+    Messages like "iPhone 15 Pro Max 256GB new" would only be echoed back by the
+    AI as a FINAL_QUERY, so they skip the AI round-trip.
+    
+    Args:
+        message: The user's message
+        history: Earlier turns of the conversation
+        
+    Returns:
+        True for a first message of at least four words that is not a question,
+        has a storage capacity and a separate model number, and contains no
+        first-person or filler words
+    """
+    if any(turn.get("role") == "user" for turn in history):
+        return False
+    if len(message.split()) < 4 or "?" in message or CONVERSATIONAL_RE.search(message):
+        return False
+    without_capacity = CAPACITY_RE.sub(" ", message)
+    return without_capacity != message and MODEL_NUMBER_RE.search(without_capacity) is not None
+
+def discard_tasks(*tasks: Optional[asyncio.Task]) -> None:
+    """Cancel speculative tasks whose results are no longer needed."""
+    for task in tasks:
+        if task is None:
+            continue
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()  # Mark any error as retrieved so it isn't logged as unhandled
+
+# --- Image Preprocessing ---
+MAX_IMAGE_DIMENSION = 1024
+IMAGE_JPEG_QUALITY = 72
+
+def downscale_image_b64(image_b64: str) -> str:
+    """
+    Shrink an uploaded image before it is stored and sent to the vision model.
+
+    Args:
+        image_b64: Base64-encoded image from the client
+
+    Returns:
+        Base64-encoded JPEG no larger than MAX_IMAGE_DIMENSION on either side,
+        or the original data if Pillow is unavailable or the image can't be decoded
+    """
+    if PILImage is None:
+        return image_b64
+    try:
+        with PILImage.open(io.BytesIO(base64.b64decode(image_b64))) as img:
+            if img.format == "JPEG" and max(img.size) <= MAX_IMAGE_DIMENSION:
+                return image_b64
+            img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            output = io.BytesIO()
+            img.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return base64.b64encode(output.getvalue()).decode()
+    except Exception as e:
+        logger.warning("⚠️  Image downscale skipped: %s", e)
+        return image_b64
+
+# Stands in for an inline image in history turns (the image itself is in the DB)
+IMAGE_PLACEHOLDER = {"type": "text", "text": "[image attached]"}
+
+def strip_inline_images(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace base64 image parts of multimodal messages with a short placeholder
+
+    Args:
+        messages: Chat messages; list contents may hold image_url parts
+
+    Returns:
+        New list; messages without images are passed through unchanged
+    """
+    stripped = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, list):
+            msg = {**msg, "content": [
+                IMAGE_PLACEHOLDER if isinstance(part, dict) and part.get("type") == "image_url" else part
+                for part in content
+            ]}
+        stripped.append(msg)
+    return stripped
+
+# --- AI Streaming ---
+AI_MODEL = "google/gemini-2.5-flash-lite"
+
+async def stream_ai_reply(messages: List[Dict[str, Any]], on_final_query=None, on_delta=None) -> str:
+    """
+    Stream a completion from OpenRouter and return the full reply.
+
+    Args:
+        messages: Messages to send to the model
+        on_final_query: Optional callback, invoked once with the query as soon as
+            a complete FINAL_QUERY line has streamed in (before the reply ends)
+        on_delta: Optional callback receiving reply text as it streams, one
+            completed line at a time (the partial line is held back, since it
+            may still turn into a FINAL_QUERY line); nothing is forwarded once
+            the marker has appeared
+
+    Returns:
+        The reply text, stripped. Generation is cut off once a complete
+        FINAL_QUERY line has arrived, since anything after it is unused.
+    """
+    stream = await ai_client.chat.completions.create(
+        model=AI_MODEL,
+        messages=messages,
+        stream=True
+    )
+    reply = ""
+    forwarded = 0  # Length of reply already passed to on_delta
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        reply += delta
+        marker = reply.rfind(FINAL_QUERY_MARKER)
+        line_end = reply.find("\n", marker) if marker != -1 else -1
+        if line_end != -1:
+            query = reply[marker + len(FINAL_QUERY_MARKER):line_end].strip()
+            if query:
+                if on_final_query is not None:
+                    on_final_query(query)
+                reply = reply[:line_end]
+                await stream.close()  # Stop generating (and paying for) trailing text
+                break
+        if on_delta is not None and marker == -1:
+            # Forward completed lines only; the partial one may become the marker
+            line_end = reply.rfind("\n") + 1
+            if line_end > forwarded:
+                text = reply[forwarded:line_end] if forwarded else reply[:line_end].lstrip()
+                if text:
+                    on_delta(text)
+                    forwarded = line_end
+    if on_delta is not None and FINAL_QUERY_MARKER not in reply:
+        text = reply[forwarded:] if forwarded else reply.lstrip()
+        if text:
+            on_delta(text)  # The last line
+    return reply.strip()
+
 
 
 # --- Request/Response Models ---
@@ -89,11 +603,18 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+# Request size limits; oversized payloads are rejected by pydantic before reaching the AI
+MAX_MESSAGE_CHARS = 4000
+MAX_HISTORY_MESSAGES = 100
+MAX_IMAGE_CHARS = 8_000_000  # ~6 MB image once base64-decoded
+
 class ChatRequest(BaseModel):
-    message: str
+    model_config = ConfigDict(strict=True, extra="ignore")
+
+    message: Annotated[str, Field(max_length=MAX_MESSAGE_CHARS)]
     conversation_id: Optional[int] = None
-    history: List[Dict[str, Any]]
-    image_data: Optional[str] = None  # Base64-encoded image
+    history: Annotated[List[Dict[str, Any]], Field(max_length=MAX_HISTORY_MESSAGES)]
+    image_data: Annotated[Optional[str], Field(max_length=MAX_IMAGE_CHARS)] = None  # Base64-encoded image
 
 class ChatResponse(BaseModel):
     type: str
@@ -105,27 +626,115 @@ class ChatResponse(BaseModel):
 
     image_data: Optional[str] = None  # Echo back image if sent
 
+# Serializer for server-built ChatResponse objects. Handlers construct responses
+# from trusted data (model_construct), so they skip validation and are dumped
+# straight to JSON.
+_CHAT_RESPONSE_ADAPTER = TypeAdapter(ChatResponse)
+
+def chat_json_response(chat_response: ChatResponse) -> Response:
+    """Return a server-built ChatResponse as raw JSON without re-validating it."""
+    return Response(
+        content=_CHAT_RESPONSE_ADAPTER.dump_json(chat_response),
+        media_type="application/json"
+    )
+
 class ConversationResponse(BaseModel):
     id: int
     title: str
     created_at: datetime
 
+# --- Prompts ---
+# Built once at import; only the date (and per-user bits) change between requests.
+
+SYSTEM_PROMPT_TEMPLATE = (
+    "You are a helpful search assistant for eBay and Amazon. Today's date is {current_date}. "
+    "Your goal is to ask the user 1-2 follow-up questions to get key details "
+    "(like model, color, size, condition, storage, or budget) to refine their search. "
+    "final search query, prefixed with 'FINAL_QUERY:'. "
+    "For the FINAL_QUERY, include the product model and storage/size, but you may include color and condition. "
+    "It is MANDATORY to include the current date in the FINAL_QUERY so the research agent knows when to check availability. "
+    "For example: 'FINAL_QUERY: iPhone 15 Pro Max 256GB blue new on February 16, 2026' or 'FINAL_QUERY: Samsung S24 Ultra 512GB on February 16, 2026'. "
+    "IMPORTANT: Your training data regarding product release dates may be outdated. "
+    "Do NOT refuse to search for a product just because you think it is unreleased. "
+    "Instead, gather the necessary details and generate the 'FINAL_QUERY' so that our "
+    "real-time verification agent can check its actual availability. "
+    "Let the verification tool be the judge of whether a product exists. "
+    "If the user provides an image, analyze it to identify the item "
+    "(brand, model, color, condition, material, style). Combine visual details with "
+    "the user's text message to generate the most accurate search query. "
+    "Describe what you see in the image before asking follow-up questions."
+)
+
+# Appended to the system prompt when RAG finds relevant past conversations
+RAG_MEMORY_TEMPLATE = (
+    "\n\n=== YOUR MEMORY OF THIS USER ===\n"
+    "{rag_context}\n"
+    "=== END OF MEMORY ===\n\n"
+    "IMPORTANT: The above is YOUR memory of this user's past searches and preferences. "
+    "ONLY reference this memory when it is DIRECTLY relevant to what the user is "
+    "currently asking about. Do NOT bring up unrelated past searches. "
+    "For example, if they are searching for a bag, do NOT mention their past phone searches. "
+    "Only mention past history if it helps refine the CURRENT search "
+    "(e.g., 'Last time you looked for a similar bag in black, want the same color?')."
+)
+
+WELCOME_MESSAGE_TEMPLATE = "Greetings {username}, I will help you find the best deals on eBay and Amazon. What are you looking for today?"
+
+def build_system_message(system_prompt: str, rag_context: str = "") -> Dict[str, Any]:
+    """
+    System message for the model, with the system prompt marked for prompt caching.
+
+    The prompt is identical for every request on a given day, so it is sent as
+    its own content part with an OpenRouter cache_control breakpoint; providers
+    that support it (Gemini, Anthropic) reuse the cached prefix instead of
+    reprocessing it. The per-user RAG memory follows in a separate part so it
+    doesn't break the cached prefix.
+
+    Args:
+        system_prompt: Rendered system prompt (see _get_system_prompt)
+        rag_context: RAG memory for this user and message, if any
+
+    Returns:
+        The {"role": "system", ...} message
+    """
+    content = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+    if rag_context:
+        content.append({"type": "text", "text": RAG_MEMORY_TEMPLATE.format(rag_context=rag_context)})
+    return {"role": "system", "content": content}
+
+@lru_cache(maxsize=1)
+def _get_system_prompt(today: date) -> str:
+    """Render the system prompt; cached so the date is only formatted when it changes."""
+    return SYSTEM_PROMPT_TEMPLATE.format(current_date=today.strftime("%B %d, %Y"))
+
+# Only the most recent turns are sent to the model; older turns add tokens
+# (and latency) without helping it narrow down the current search.
+MAX_PROMPT_MESSAGES = 40
+
 # --- Auth Endpoints ---
 
 @app.post("/register", response_model=Token)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    # Session calls block on SQLite, so they run on worker threads (see process_chat)
+    db_user = await asyncio.to_thread(
+        db.query(models.User).filter(models.User.username == user.username).first
+    )
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Validate password strength
     auth.validate_password_strength(user.password)
     
-    hashed_password = auth.get_password_hash(user.password)
+    # bcrypt takes ~100-300ms of CPU; hash on a worker thread to keep the event loop free
+    hashed_password = await asyncio.to_thread(auth.get_password_hash, user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+
+    def save_user():
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+
+    await asyncio.to_thread(save_user)
     
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
@@ -209,30 +818,80 @@ def build_a2ui_from_results(results: Dict) -> Optional[A2UIMessage]:
             )
         )
     except Exception as e:
-        print(f"⚠️ Error constructing A2UI message: {e}")
+        logger.warning("⚠️ Error constructing A2UI message: %s", e)
         return None
 
 @app.get("/conversations/{conversation_id}", response_model=List[Dict])
 def get_conversation_history(
     conversation_id: int,
+    limit: Annotated[Optional[int], Query(ge=1, le=500)] = None,
+    before_id: Optional[int] = None,
+    include: Literal["full", "summary"] = "full",
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    conversation = db.query(models.Conversation).filter(
+    """
+    Messages of a conversation, oldest first.
+
+    Long threads can be paged: limit returns only the newest messages, and
+    before_id (a message id from a previous page) continues further back.
+    include=summary skips the heavy results/image columns and flags them instead;
+    images are then fetched one at a time from the message image endpoint.
+    """
+    owned = [
         models.Conversation.id == conversation_id,
         models.Conversation.user_id == current_user.id
-    ).first()
+    ]
+    if include == "full":
+        columns = (
+            models.Chat.id,
+            models.Chat.role,
+            models.Chat.message,
+            models.Chat.results,
+            models.Chat.image_data
+        )
+    else:
+        columns = (
+            models.Chat.id,
+            models.Chat.role,
+            models.Chat.message,
+            models.Chat.results.isnot(None).label("has_results"),
+            models.Chat.image_data.isnot(None).label("has_image")
+        )
+
+    # One joined query checks ownership and loads the messages; selecting only
+    # the needed columns returns plain rows instead of hydrated ORM objects
+    query = db.query(*columns).join(models.Conversation).filter(*owned)
+    if before_id is not None:
+        query = query.filter(models.Chat.id < before_id)
+    if limit is None:
+        messages = query.order_by(models.Chat.timestamp.asc()).all()
+    else:
+        # Newest page first from the index, then back to chronological order
+        messages = query.order_by(
+            models.Chat.timestamp.desc(), models.Chat.id.desc()
+        ).limit(limit).all()[::-1]
     
-    if not conversation:
+    # No rows: either an empty conversation or one that isn't ours / doesn't exist
+    if not messages and db.query(models.Conversation.id).filter(*owned).scalar() is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-        
-    messages = db.query(models.Chat).filter(
-        models.Chat.conversation_id == conversation_id
-    ).order_by(models.Chat.timestamp.asc()).all()
     
+    if include == "summary":
+        return [
+            {
+                "id": msg.id,
+                "role": msg.role,
+                "content": msg.message,
+                "has_results": msg.has_results,
+                "has_image": msg.has_image
+            }
+            for msg in messages
+        ]
+
     # Include results, image_data, and generated A2UI content
     return [
         {
+            "id": msg.id,
             "role": msg.role, 
             "content": msg.message,
             "results": msg.results if msg.results else None,
@@ -242,21 +901,52 @@ def get_conversation_history(
         for msg in messages
     ]
 
+@app.get("/conversations/{conversation_id}/messages/{message_id}/image")
+def get_message_image(
+    conversation_id: int,
+    message_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Serve one message's uploaded image as bytes (for include=summary history)."""
+    image_data = db.query(models.Chat.image_data).join(models.Conversation).filter(
+        models.Chat.id == message_id,
+        models.Conversation.id == conversation_id,
+        models.Conversation.user_id == current_user.id
+    ).scalar()
+    if not image_data:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # Uploads are stored as base64 JPEG (see downscale_image_b64)
+    return Response(
+        content=base64.b64decode(image_data),
+        media_type="image/jpeg",
+        headers={"Cache-Control": "private, max-age=86400"}
+    )
+
 @app.delete("/conversations/{conversation_id}")
 def delete_conversation(
     conversation_id: int,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    conversation = db.query(models.Conversation).filter(
+    # Bulk DELETEs: no ORM load, and the owner filter doubles as the 404 check
+    owned = db.query(models.Conversation).filter(
         models.Conversation.id == conversation_id,
         models.Conversation.user_id == current_user.id
-    ).first()
+    )
     
-    if not conversation:
+    # Chats first: databases created before the FK had ON DELETE CASCADE would
+    # otherwise fail the foreign key check
+    db.query(models.Chat).filter(
+        models.Chat.conversation_id.in_(owned.with_entities(models.Conversation.id).scalar_subquery())
+    ).delete(synchronize_session=False)
+    deleted = owned.delete(synchronize_session=False)
+    
+    if not deleted:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Conversation not found")
-        
-    db.delete(conversation)
+    
     db.commit()
     return {"message": "Conversation deleted"}
 
@@ -266,19 +956,163 @@ def delete_conversation(
 @app.post("/chat", response_model=ChatResponse)
 async def handle_chat(
     request: ChatRequest, 
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    chat_response = await process_chat(request, current_user, db, background_tasks=background_tasks)
+    return chat_json_response(chat_response)
+
+@app.post("/chat/stream")
+async def handle_chat_stream(
+    request: ChatRequest, 
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Same as /chat, but streamed as newline-delimited JSON so the client can show
+    progress while the reply is generated and verification and searches run.
+    Emits zero or more {"event": "delta", "text": ...} lines (conversational
+    reply text as it streams) and {"event": "status", "message": ...} lines,
+    then one {"event": "response", "data": <ChatResponse>} line (or
+    {"event": "error", ...} on failure). The response line is authoritative.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run() -> ChatResponse:
+        try:
+            return await process_chat(
+                request, current_user, db,
+                emit=queue.put_nowait, background_tasks=background_tasks
+            )
+        finally:
+            queue.put_nowait(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while (event := await queue.get()) is not None:
+                yield orjson.dumps(event) + b"\n"
+            try:
+                chat_response = await task
+            except HTTPException as e:
+                yield orjson.dumps({"event": "error", "status": e.status_code, "detail": e.detail}) + b"\n"
+                return
+            except Exception as e:
+                logger.error("✗ Streaming chat error: %s", e)
+                yield orjson.dumps({"event": "error", "status": 500, "detail": "Internal server error"}) + b"\n"
+                return
+            yield b'{"event":"response","data":' + _CHAT_RESPONSE_ADAPTER.dump_json(chat_response) + b"}\n"
+        finally:
+            if not task.done():
+                task.cancel()  # Client disconnected mid-stream
+
+    # "identity" makes GZipMiddleware pass the stream through; compressing it
+    # would hold small events back in the gzip buffer
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Encoding": "identity"}
+    )
+
+def store_turn_embeddings(
+    user_id: int,
+    conversation_id: int,
+    reply: str,
+    user_message: Optional[str],
+    metadata: Optional[Dict] = None
+):
+    """
+    Store a finished chat turn in Pinecone for RAG (run as a background task).
+
+    Both messages go in one embeddings request and one upsert. They are written
+    after the response, so the current message never comes back as "past history".
+
+    Args:
+        user_id: User ID
+        conversation_id: Conversation ID
+        reply: The assistant message for this turn
+        user_message: The user's message (skipped if empty)
+        metadata: Extra metadata for the assistant message
+    """
+    messages = [{
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "message": reply,
+        "role": "assistant",
+        "metadata": metadata
+    }]
+    if user_message:
+        messages.append({
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "message": user_message,
+            "role": "user"
+        })
+
+    try:
+        stored = embedding_service.store_messages_batch(messages)
+        if stored < len(messages):
+            logger.warning("⚠️  Stored %d of %d turn messages in Pinecone", stored, len(messages))
+    except Exception as e:
+        logger.warning("⚠️  Failed to store chat turn in Pinecone: %s", e)
+
+async def process_chat(
+    request: ChatRequest,
+    current_user: models.User,
+    db: Session,
+    emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> ChatResponse:
+    """
+    Run one chat turn: call the AI and, for a final query, verify and search.
+
+    Args:
+        request: The chat request
+        current_user: Authenticated user
+        db: Database session
+        emit: Optional callback receiving progress events (used by /chat/stream)
+        background_tasks: Post-response tasks (Pinecone writes); skipped if None
+
+    Returns:
+        The ChatResponse for this turn
+    """
+    def notify(message: str):
+        if emit:
+            emit({"event": "status", "message": message})
+
     # Handle Conversation ID
     conversation_id = request.conversation_id
     
+    # The Session is synchronous, so every query and commit below runs on a worker
+    # thread; blocking on SQLite in this coroutine would stall every other request
+    # served by the event loop. The calls are awaited one at a time, so the Session
+    # is never used by two threads at once. The user's id is read up front because
+    # commit() expires current_user (it shares this Session) and a reload would
+    # query from the event loop.
+    user_id = current_user.id
+
+    # An opening message that already names a specific product goes straight to
+    # verification and search, without the AI round-trip (or its RAG context)
+    direct_query = not request.image_data and is_specific_product_query(request.message, request.history)
+
+    # Retrieve RAG context from user's past conversations. It only depends on the
+    # message, so it runs alongside the DB work and image downscaling below.
+    rag_task = None
+    if embedding_service and request.message and not direct_query:
+        rag_task = asyncio.create_task(get_rag_context_cached(user_id, request.message))
+
     if conversation_id:
         # Verify ownership
-        conversation = db.query(models.Conversation).filter(
-            models.Conversation.id == conversation_id,
-            models.Conversation.user_id == current_user.id
-        ).first()
+        conversation = await asyncio.to_thread(
+            db.query(models.Conversation).filter(
+                models.Conversation.id == conversation_id,
+                models.Conversation.user_id == user_id
+            ).first
+        )
         if not conversation:
+            discard_tasks(rag_task)
             raise HTTPException(status_code=404, detail="Conversation not found")
     else:
         # Create new conversation
@@ -287,91 +1121,61 @@ async def handle_chat(
         if request.message:
             title = (request.message[:30] + '..') if len(request.message) > 30 else request.message
             
-        conversation = models.Conversation(user_id=current_user.id, title=title)
+        conversation = models.Conversation(user_id=user_id, title=title)
         db.add(conversation)
+
+    # The turn's rows (new conversation, user message, reply) are written in a
+    # single commit once the reply is known. Nothing is flushed before that, so
+    # no SQLite write lock is held while waiting on the AI and MCP servers.
+    def write_turn(chats) -> int:
+        db.add_all(chats)
+        db.flush()  # Assigns the id of a new conversation
+        new_id = conversation.id  # Read before commit() expires the instance
         db.commit()
-        db.refresh(conversation)
-        conversation_id = conversation.id
+        return new_id
+
+    async def commit_turn(*chats: models.Chat):
+        nonlocal conversation_id
+        conversation_id = await asyncio.to_thread(write_turn, chats)
+
+    # Downscale uploaded images once (off the event loop); the smaller JPEG is
+    # both stored and sent to the model
+    image_data = request.image_data
+    if image_data:
+        image_data = await asyncio.to_thread(downscale_image_b64, image_data)
 
     # Save User Message to DB
-    if request.message or request.image_data:
+    if request.message or image_data:
         user_msg = models.Chat(
-            conversation_id=conversation_id, 
+            conversation=conversation, 
             message=request.message or "", 
             role="user",
-            image_data=request.image_data
+            image_data=image_data
         )
         db.add(user_msg)
-        db.commit()
         
         # NOTE: We'll store in Pinecone AFTER getting AI response
         # to avoid retrieving the current message as "past history"
 
-    # Retrieve RAG context from user's past conversations
-    rag_context = ""
-    if embedding_service and request.message:
-        try:
-            rag_context = embedding_service.get_user_context(
-                user_id=current_user.id,
-                query=request.message,
-                top_k=3
-            )
-            if rag_context:
-                print(f"📚 RAG Context retrieved:\n{rag_context}")
-        except Exception as e:
-            print(f"⚠️  Failed to retrieve RAG context: {e}")
-
-    # System prompt
-    current_date = datetime.now().strftime("%B %d, %Y")
-    system_prompt = (
-        f"You are a helpful search assistant for eBay and Amazon. Today's date is {current_date}. "
-        "Your goal is to ask the user 1-2 follow-up questions to get key details "
-        "(like model, color, size, condition, storage, or budget) to refine their search. "
-        "final search query, prefixed with 'FINAL_QUERY:'. "
-        "For the FINAL_QUERY, include the product model and storage/size, but you may include color and condition. "
-        "It is MANDATORY to include the current date in the FINAL_QUERY so the research agent knows when to check availability. "
-        "For example: 'FINAL_QUERY: iPhone 15 Pro Max 256GB blue new on February 16, 2026' or 'FINAL_QUERY: Samsung S24 Ultra 512GB on February 16, 2026'. "
-        "IMPORTANT: Your training data regarding product release dates may be outdated. "
-        "Do NOT refuse to search for a product just because you think it is unreleased. "
-        "Instead, gather the necessary details and generate the 'FINAL_QUERY' so that our "
-        "real-time verification agent can check its actual availability. "
-        "Let the verification tool be the judge of whether a product exists. "
-        "If the user provides an image, analyze it to identify the item "
-        "(brand, model, color, condition, material, style). Combine visual details with "
-        "the user's text message to generate the most accurate search query. "
-        "Describe what you see in the image before asking follow-up questions."
-    )
-    
-    # Enhance system prompt with RAG context if available
-    if rag_context:
-        system_prompt = (
-            f"{system_prompt}\n\n"
-            f"=== YOUR MEMORY OF THIS USER ===\n"
-            f"{rag_context}\n"
-            f"=== END OF MEMORY ===\n\n"
-            f"IMPORTANT: The above is YOUR memory of this user's past searches and preferences. "
-            f"ONLY reference this memory when it is DIRECTLY relevant to what the user is "
-            f"currently asking about. Do NOT bring up unrelated past searches. "
-            f"For example, if they are searching for a bag, do NOT mention their past phone searches. "
-            f"Only mention past history if it helps refine the CURRENT search "
-            f"(e.g., 'Last time you looked for a similar bag in black, want the same color?')."
-        )
+    rag_context = await rag_task if rag_task else ""
+
+    # System prompt (rendered once per day, see _get_system_prompt)
+    today = date.today()
+    system_prompt = _get_system_prompt(today)
     
-    welcome_message = f"Greetings {current_user.username}, I will help you find the best deals on eBay and Amazon. What are you looking for today?"
+    welcome_message = WELCOME_MESSAGE_TEMPLATE.format(username=current_user.username)
     
     # Handle initial welcome (only for new empty chats)
     if not request.message and not request.history:
         # If it's a new conversation, save the welcome message
-        ai_msg_db = models.Chat(
-            conversation_id=conversation_id, 
+        await commit_turn(models.Chat(
+            conversation=conversation, 
             message=welcome_message, 
             role="assistant"
-        )
-        db.add(ai_msg_db)
-        db.commit()
+        ))
         
-        print("INFO: Sending initial welcome message")
-        return ChatResponse(
+        logger.debug("Sending initial welcome message")
+        return ChatResponse.model_construct(
             type="question",
             message=welcome_message,
             conversation_id=conversation_id,
@@ -381,11 +1185,8 @@ async def handle_chat(
             ]
         )
 
-    # Prepare chat history
-    chat_history = request.history
-    
     # Build the user message content — multimodal if image is present
-    if request.image_data:
+    if image_data:
         # Multimodal message: list of content parts (text + image)
         user_content = []
         if request.message:
@@ -393,70 +1194,100 @@ async def handle_chat(
         user_content.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{request.image_data}"
+                "url": f"data:image/jpeg;base64,{image_data}"
             }
         })
-        chat_history.append({"role": "user", "content": user_content})
     else:
-        chat_history.append({"role": "user", "content": request.message})
+        user_content = request.message
+
+    # Prepare chat history (built once; the assistant reply is appended later).
+    # Only the current turn's image goes to the model; earlier ones (and the one
+    # echoed back in the response history) are replaced with a placeholder, so a
+    # multi-MB data URL isn't resent and re-serialized on every later turn.
+    user_turn = {"role": "user", "content": user_content}
+    chat_history = strip_inline_images([*request.history, user_turn])
     
     # Prepend system prompt to ensure AI always knows the context and date
-    messages_for_ai = [{"role": "system", "content": system_prompt}] + chat_history
+    # (enhanced with RAG context if available)
+    messages_for_ai = [
+        build_system_message(system_prompt, rag_context),
+        *chat_history[-MAX_PROMPT_MESSAGES:-1],
+        user_turn
+    ]
     
+    # Verification and search for a final query run as background tasks, so they
+    # can start while the reply is still streaming and overlap with each other
+    prefetch: Dict[str, Any] = {}
+
+    def start_prefetch(query: str):
+        prefetch["query"] = query
+        prefetch["verify"] = asyncio.create_task(verify_product_cached(query))
+        commerce_query = strip_query_date(query)
+        logger.debug("🔎 Searching eBay and Amazon (HTTP) for: %s", commerce_query)
+        prefetch["search"] = asyncio.create_task(search_products_cached(commerce_query))
+
     # Call AI
     try:
-        response = ai_client.chat.completions.create(
-            model="google/gemini-2.5-flash-lite",
-            messages=messages_for_ai
-        )
-        ai_message = response.choices[0].message.content.strip()
-        print(f"🤖 AI Raw Response: {ai_message}") # DEBUG PRINT
+        if direct_query:
+            # Written in the form the AI would reply with (date appended)
+            ai_message = f"{FINAL_QUERY_MARKER} {request.message.strip()} on {today.strftime('%B %d, %Y')}"
+            logger.debug("⚡ Specific query, skipping the AI: %s", ai_message)
+        else:
+            ai_message, cache_token = await llm_cache.lookup(AI_MODEL, messages_for_ai)
+        if ai_message is None:
+            ai_message = await stream_ai_reply(
+                messages_for_ai,
+                on_final_query=start_prefetch,
+                on_delta=(lambda text: emit({"event": "delta", "text": text})) if emit else None
+            )
+            await llm_cache.store(cache_token, ai_message)
+        logger.debug("🤖 AI Raw Response: %s", ai_message)
         
     except Exception as e:
-        print(f"✗ Error communicating with OpenRouter: {e}")
-        return ChatResponse(
+        discard_tasks(prefetch.get("verify"), prefetch.get("search"))
+        logger.error("✗ Error communicating with OpenRouter: %s", e)
+        await commit_turn()  # Keep the user's message
+        return ChatResponse.model_construct(
             type="question",
             message="Sorry, I had an error connecting to the AI. Please try again.",
             conversation_id=conversation_id,
             history=chat_history
         )
 
-    # Check if it's a final query
-    if "FINAL_QUERY:" in ai_message: # More lenient check
+    # Check if it's a final query (one right-to-left scan finds the last marker)
+    _, marker, final_query = ai_message.rpartition(FINAL_QUERY_MARKER)
+    if marker: # More lenient check
         # Extract query even if there's surrounding text (though prompt says ONLY)
-        parts = ai_message.split("FINAL_QUERY:")
-        final_query = parts[-1].strip()
+        final_query = final_query.strip()
+
+        # Start (or restart, if the streamed line differs from the final query)
+        if prefetch.get("query") != final_query:
+            discard_tasks(prefetch.get("verify"), prefetch.get("search"))
+            start_prefetch(final_query)
         
         # Extract base product name for verification (remove color/condition modifiers)
         # This helps avoid false negatives when users specify colors that don't match official names
-        import re
-        verification_query = final_query
-        # Remove common color words and condition words for verification
-        color_condition_words = r'\b(black|white|blue|red|green|yellow|orange|purple|pink|gray|grey|silver|gold|rose|titanium|new|used|refurbished|unlocked|sealed)\b'
-        verification_query = re.sub(color_condition_words, '', final_query, flags=re.IGNORECASE).strip()
+        verification_query = COLOR_CONDITION_RE.sub('', final_query)
         # Clean up extra spaces
         verification_query = ' '.join(verification_query.split())
         
         # --- Call Research Agent (HTTP) ---
         # The Research Agent NEEDS the date to check availability
-        print(f"🔍 Research Agent (HTTP): Verifying '{final_query}'...")
+        logger.debug("🔍 Research Agent (HTTP): Verifying '%s'...", final_query)
+        notify(f"Checking that '{final_query}' is available...")
         try:
-            research_response = await http_client.post(
-                f"{RESEARCH_AGENT_URL}/verify_product",
-                json={"product_name": final_query} # Send full query with date
-            )
-            verification = research_response.json()
+            verification = await prefetch["verify"] # Full query with date
             
-            # DEBUG: Print full verification output
-            import json
-            print(f"📋 Research Agent Output:\n{json.dumps(verification, indent=2)}")
+            # Full verification output (only serialized when debug logging is on)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📋 Research Agent Output:\n%s", orjson.dumps(verification, option=orjson.OPT_INDENT_2).decode())
             
             release_status = verification.get('release_status', 'unknown')
-            print(f"   Release Status: {release_status}")
+            logger.debug("   Release Status: %s", release_status)
             
             # Block unreleased products
             if not verification.get('exists') and verification.get('confidence') in ['high', 'medium']:
-                print(f"⚠️  Product verification failed: {verification.get('info')}")
+                logger.info("⚠️  Product verification failed: %s", verification.get('info'))
                 
                 if release_status == 'upcoming':
                     message = f"The '{final_query}' hasn't been released yet. {verification.get('info')} Would you like to search for a currently available alternative?"
@@ -465,62 +1296,38 @@ async def handle_chat(
                 else:
                     message = f"I couldn't find reliable information about '{final_query}'. {verification.get('info')} Would you like to search for something else?"
                 
+                # The speculative search is not needed
+                discard_tasks(prefetch["search"])
+
                 # Save this user-friendly message to DB instead of FINAL_QUERY
                 chat_history.append({"role": "assistant", "content": message})
-                ai_msg_db = models.Chat(
-                    conversation_id=conversation_id, 
+                await commit_turn(models.Chat(
+                    conversation=conversation, 
                     message=message, 
                     role="assistant"
-                )
-                db.add(ai_msg_db)
-                db.commit()
+                ))
                 
-                return ChatResponse(
+                return ChatResponse.model_construct(
                     type="question",
                     message=message,
                     conversation_id=conversation_id,
                     history=chat_history
                 )
             else:
-                print(f"✓ Product verified: {verification.get('info')}")
+                logger.debug("✓ Product verified: %s", verification.get('info'))
         except Exception as e:
-            print(f"⚠️  Research agent error: {e}")
+            logger.warning("⚠️  Research agent error: %s", e)
         
         # --- Search eBay and Amazon (HTTP) ---
-        # Strip the date for commerce sites (they don't need "on February 16, 2026")
-        # Regex to remove " on <Month> <Day>, <Year>"
-        commerce_query = re.sub(r' on [A-Za-z]+ \d{1,2}, \d{4}', '', final_query, flags=re.IGNORECASE).strip()
-        print(f"🔎 Searching eBay and Amazon (HTTP) for: {commerce_query}")
-        
-        # Search eBay
-        ebay_results = []
-        try:
-            ebay_response = await http_client.post(
-                f"{EBAY_AGENT_URL}/search",
-                json={"query": commerce_query, "limit": 4}
-            )
-            ebay_data = ebay_response.json()
-            ebay_results = ebay_data.get("results", [])
-            print(f"✓ Found {len(ebay_results)} eBay results (HTTP)")
-        except Exception as e:
-            print(f"⚠️  eBay search error: {e}")
-        
-        # Search Amazon
-        amazon_results = []
-        try:
-            amazon_response = await http_client.post(
-                f"{AMAZON_AGENT_URL}/search",
-                json={"query": commerce_query}
-            )
-            amazon_data = amazon_response.json()
-            amazon_results = amazon_data.get("results", [])
-            print(f"✓ Found {len(amazon_results)} Amazon results (HTTP)")
-        except Exception as e:
-            print(f"⚠️  Amazon search error: {e}")
+        # Already running since start_prefetch (with the date stripped for commerce sites)
+        notify(f"Great! Searching eBay and Amazon for: '{final_query}'")
+        search_results = await prefetch["search"]
+        ebay_results = search_results["ebay"]
+        amazon_results = search_results["amazon"]
 
         # Create user-friendly message for results
         results_message = f"Great! I searched both eBay and Amazon for: '{final_query}'"
-        results_data = {"ebay": ebay_results, "amazon": amazon_results}
+        results_data = search_results
 
         # --- Generate A2UI Content ---
         a2ui_message = None
@@ -566,45 +1373,25 @@ async def handle_chat(
                         )
                     )
             except Exception as e:
-                print(f"⚠️ Error constructing A2UI message: {e}")
+                logger.warning("⚠️ Error constructing A2UI message: %s", e)
         
         # Save this message AND results to DB
         chat_history.append({"role": "assistant", "content": results_message})
-        ai_msg_db = models.Chat(
-            conversation_id=conversation_id, 
+        await commit_turn(models.Chat(
+            conversation=conversation, 
             message=results_message, 
             role="assistant",
             results=results_data  # Save results as JSON
-        )
-        db.add(ai_msg_db)
-        db.commit()
-        
-        # Store AI response in Pinecone for RAG
-        if embedding_service:
-            try:
-                embedding_service.store_message(
-                    user_id=current_user.id,
-                    conversation_id=conversation_id,
-                    message=results_message,
-                    role="assistant",
-                    metadata={"product_query": final_query}
-                )
-            except Exception as e:
-                print(f"⚠️  Failed to store AI response in Pinecone: {e}")
+        ))
         
-        # NOW store the user's message in Pinecone (after AI response)
-        if embedding_service and request.message:
-            try:
-                embedding_service.store_message(
-                    user_id=current_user.id,
-                    conversation_id=conversation_id,
-                    message=request.message,
-                    role="user"
-                )
-            except Exception as e:
-                print(f"⚠️  Failed to store user message in Pinecone: {e}")
+        # Store the turn in Pinecone for RAG once the response has been sent
+        if embedding_service and background_tasks:
+            background_tasks.add_task(
+                store_turn_embeddings, user_id, conversation_id,
+                results_message, request.message, {"product_query": final_query}
+            )
 
-        return ChatResponse(
+        return ChatResponse.model_construct(
             type="results",
             message=results_message,
             conversation_id=conversation_id,
@@ -618,40 +1405,20 @@ async def handle_chat(
         chat_history.append({"role": "assistant", "content": ai_message})
         
         # Save AI response to DB
-        ai_msg_db = models.Chat(
-            conversation_id=conversation_id, 
+        await commit_turn(models.Chat(
+            conversation=conversation, 
             message=ai_message, 
             role="assistant"
-        )
-        db.add(ai_msg_db)
-        db.commit()
-        
-        # Store AI response in Pinecone for RAG
-        if embedding_service:
-            try:
-                embedding_service.store_message(
-                    user_id=current_user.id,
-                    conversation_id=conversation_id,
-                    message=ai_message,
-                    role="assistant"
-                )
-            except Exception as e:
-                print(f"⚠️  Failed to store AI response in Pinecone: {e}")
+        ))
         
-        # NOW store the user's message in Pinecone (after AI response)
-        # This prevents the current message from appearing as "past history"
-        if embedding_service and request.message:
-            try:
-                embedding_service.store_message(
-                    user_id=current_user.id,
-                    conversation_id=conversation_id,
-                    message=request.message,
-                    role="user"
-                )
-            except Exception as e:
-                print(f"⚠️  Failed to store user message in Pinecone: {e}")
+        # Store the turn in Pinecone for RAG once the response has been sent
+        if embedding_service and background_tasks:
+            background_tasks.add_task(
+                store_turn_embeddings, user_id, conversation_id,
+                ai_message, request.message
+            )
         
-        return ChatResponse(
+        return ChatResponse.model_construct(
             type="question",
             message=ai_message,
             conversation_id=conversation_id,
@@ -660,7 +1427,16 @@ async def handle_chat(
 
 # --- Virtual Try-On Endpoint ---
 from fastapi import UploadFile, File, Depends, Response
+from starlette.background import BackgroundTask
 import time
+
+# Kept for the app's lifetime so repeat try-ons reuse warm TLS connections to the
+# image API; generation is slow, hence the long read timeout
+nano_banana_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+)
+
 @app.post("/virtual-try-on")
 async def virtual_try_on(
     clothing_image: UploadFile = File(...),
@@ -671,66 +1447,89 @@ async def virtual_try_on(
     Real Virtual Try-On integration with Nano Banana API.
     Forwards user images to the AI service and returns the result.
     """
-    print(f"🍌 Virtual Try-On Request from {current_user.username}")
+    logger.info("🍌 Virtual Try-On Request from %s", current_user.username)
     
     # 1. Configuration - Get these from your .env file or AI Studio dashboard
     NANO_BANANA_API_URL = os.getenv("NANO_BANANA_API_URL", "YOUR_ACTUAL_API_ENDPOINT_HERE")
     NANO_BANANA_API_KEY = os.getenv("NANO_BANANA_API_KEY")
 
     if not NANO_BANANA_API_URL or "YOUR_ACTUAL" in NANO_BANANA_API_URL:
-        print("❌ Error: Nano Banana API URL not configured")
+        logger.error("❌ Error: Nano Banana API URL not configured")
         raise HTTPException(status_code=500, detail="Server misconfiguration: Missing API URL")
 
     try:
-        # 2. Read file contents into memory
-        clothing_bytes = await clothing_image.read()
-        avatar_bytes = await avatar_image.read()
-
-        # 3. Prepare the request to your AI Studio API
-        # We use a timeout of 60s because image generation can be slow
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            print("🚀 Sending images to Nano Banana API...")
-            
-            # Construct Multipart Form Data
-            # Adjust field names ('clothing', 'avatar') if your API expects specific names
-            files = {
-                'clothing_image': (clothing_image.filename, clothing_bytes, clothing_image.content_type),
-                'avatar_image': (avatar_image.filename, avatar_bytes, avatar_image.content_type)
-            }
-            
-            headers = {}
-            if NANO_BANANA_API_KEY:
-                headers["Authorization"] = f"Bearer {NANO_BANANA_API_KEY}"
-                # Or if it uses x-api-key:
-                # headers["x-api-key"] = NANO_BANANA_API_KEY
-
-            # 4. Make the call
-            response = await client.post(
-                NANO_BANANA_API_URL,
-                files=files,
-                headers=headers
-            )
+        # 2. Prepare the request to your AI Studio API
+        logger.debug("🚀 Sending images to Nano Banana API...")
+        
+        # Construct Multipart Form Data
+        # Adjust field names ('clothing', 'avatar') if your API expects specific names
+        # The uploads' spooled files are passed as-is, so httpx streams them in
+        # chunks instead of both images being read into memory first
+        files = {
+            'clothing_image': (clothing_image.filename, clothing_image.file, clothing_image.content_type),
+            'avatar_image': (avatar_image.filename, avatar_image.file, avatar_image.content_type)
+        }
+        
+        headers = {}
+        if NANO_BANANA_API_KEY:
+            headers["Authorization"] = f"Bearer {NANO_BANANA_API_KEY}"
+            # Or if it uses x-api-key:
+            # headers["x-api-key"] = NANO_BANANA_API_KEY
 
-            # 5. Check response
-            if response.status_code != 200:
-                print(f"❌ AI API Error: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=502, 
-                    detail=f"AI Processing Failed: {response.text[:100]}"
-                )
+        # 3. Make the call (streamed: only the headers are read here)
+        request = nano_banana_client.build_request(
+            "POST",
+            NANO_BANANA_API_URL,
+            files=files,
+            headers=headers
+        )
+        response = await nano_banana_client.send(request, stream=True)
 
-            print("✅ Received result from AI")
-            
-            # 6. Return the generated image bytes directly
-            return Response(content=response.content, media_type="image/png")
+        # 4. Check response
+        if response.status_code != 200:
+            error_text = (await response.aread()).decode(errors="replace")
+            await response.aclose()
+            logger.error("❌ AI API Error: %s - %s", response.status_code, error_text)
+            raise HTTPException(
+                status_code=502, 
+                detail=f"AI Processing Failed: {error_text[:100]}"
+            )
 
+        logger.debug("✅ Received result from AI")
+        
+        # 5. Relay the generated image as it arrives instead of buffering it all
+        # first; the upstream response is closed once the relay finishes. PNG
+        # data doesn't compress, so "identity" keeps GZipMiddleware out of it.
+        return StreamingResponse(
+            response.aiter_bytes(chunk_size=64 * 1024),
+            media_type="image/png",
+            headers={"Content-Encoding": "identity"},
+            background=BackgroundTask(response.aclose)
+        )
+
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
-        print(f"❌ Connection Error: {e}")
+        logger.error("❌ Connection Error: %s", e)
         raise HTTPException(status_code=503, detail="AI Service Unavailable")
     except Exception as e:
-        print(f"❌ Unexpected Error: {e}")
+        logger.error("❌ Unexpected Error: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error during processing")
 
 if __name__ == "__main__":
+    # Multiple workers with uvloop/httptools by default; DEV=1 runs a single auto-reloading worker
+    dev_mode = os.getenv("DEV", "0") == "1"
     print("Starting Main API Server (HTTP-based MCP) at http://0.0.0.0:8000")
-    uvicorn.run("api_mcp:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "api_mcp:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=dev_mode,
+        workers=None if dev_mode else int(os.getenv("WEB_CONCURRENCY", "4")),
+        loop="uvloop",
+        http="httptools",
+        ws="none",  # Pure HTTP API; skip loading a WebSocket implementation
+        # Per-worker cap on open connections/in-flight requests; beyond it new
+        # requests get a fast 503 instead of queueing up memory under bursts
+        limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", "100"))
+    )
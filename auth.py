@@ -1,7 +1,11 @@
+import os
 import bcrypt
 import re
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional
+from cachetools import TTLCache
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -14,8 +18,20 @@ SECRET_KEY = "supersecretkey"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt work factor for new hashes (existing hashes keep the cost they were made with)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# User ids resolved from a token, by raw token string. Repeat requests within the
+# TTL skip the JWT decode and the username lookup; the user row itself is loaded
+# by primary key into the request's Session, so endpoints always get a real,
+# attached User (and a deleted user is rejected at once). Entries are checked
+# against the token's own expiry too.
+USER_CACHE_TTL = 60
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()  # get_current_user runs on threadpool workers
+
 def verify_password(plain_password, hashed_password):
     # bcrypt requires bytes
     if isinstance(hashed_password, str):
@@ -23,7 +39,7 @@ def verify_password(plain_password, hashed_password):
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
 
 def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def validate_password_strength(password: str) -> bool:
     """
@@ -62,6 +78,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    with _user_cache_lock:
+        cached = _user_cache.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if expires_at > time.time():
+            user = db.get(models.User, user_id)
+            if user is None:
+                raise credentials_exception
+            return user
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -73,4 +99,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
+    
+    with _user_cache_lock:
+        _user_cache[token] = (user.id, payload.get("exp", 0))
     return user
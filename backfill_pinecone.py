@@ -11,6 +11,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+BATCH_SIZE = 100  # Messages per embeddings request / Pinecone upsert
+
 def backfill_pinecone():
     """
     Read all messages from SQLite and store them in Pinecone
@@ -21,47 +23,57 @@ def backfill_pinecone():
     db = SessionLocal()
     embedding_service = EmbeddingService()
     
-    # Get all chat messages
-    all_messages = db.query(models.Chat).order_by(models.Chat.timestamp.asc()).all()
+    # Get all chat messages with their owner in one query (outer join, so
+    # messages whose conversation is missing can be reported and skipped)
+    all_messages = db.query(models.Chat, models.Conversation.user_id).outerjoin(
+        models.Conversation, models.Chat.conversation_id == models.Conversation.id
+    ).order_by(models.Chat.timestamp.asc()).all()
     
     print(f"📊 Found {len(all_messages)} messages in database")
     
     success_count = 0
     error_count = 0
+    skipped_count = 0
+    
+    batch = []
+    for i, (msg, user_id) in enumerate(all_messages, 1):
+        if user_id is None:
+            print(f"⚠️  Skipping message {i}: No conversation found")
+            skipped_count += 1
+            continue
+        
+        # Nothing to embed (e.g. image-only messages); not an error
+        if not (msg.message or "").strip():
+            skipped_count += 1
+            continue
+        
+        batch.append({
+            "user_id": user_id,
+            "conversation_id": msg.conversation_id,
+            "message": msg.message,
+            "role": msg.role
+        })
+        
+        # Embed and upsert in batches: one embeddings request and one Pinecone
+        # upsert per BATCH_SIZE messages instead of one of each per message
+        if len(batch) == BATCH_SIZE:
+            stored = embedding_service.store_messages_batch(batch)
+            success_count += stored
+            error_count += len(batch) - stored
+            batch = []
+            print(f"✓ Processed {i}/{len(all_messages)} messages...")
     
-    for i, msg in enumerate(all_messages, 1):
-        try:
-            # Get user_id from conversation
-            conversation = db.query(models.Conversation).filter(
-                models.Conversation.id == msg.conversation_id
-            ).first()
-            
-            if not conversation:
-                print(f"⚠️  Skipping message {i}: No conversation found")
-                continue
-            
-            # Store in Pinecone
-            embedding_service.store_message(
-                user_id=conversation.user_id,
-                conversation_id=msg.conversation_id,
-                message=msg.message,
-                role=msg.role
-            )
-            
-            success_count += 1
-            
-            if i % 10 == 0:
-                print(f"✓ Processed {i}/{len(all_messages)} messages...")
-                
-        except Exception as e:
-            error_count += 1
-            print(f"✗ Error processing message {i}: {e}")
+    if batch:
+        stored = embedding_service.store_messages_batch(batch)
+        success_count += stored
+        error_count += len(batch) - stored
     
     db.close()
     
     print(f"\n✅ Backfill complete!")
     print(f"   Success: {success_count}")
     print(f"   Errors: {error_count}")
+    print(f"   Skipped: {skipped_count}")
     print(f"   Total: {len(all_messages)}")
 
 if __name__ == "__main__":
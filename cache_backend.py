@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Cache Backends - persistent storage for the result and response caches
+Entries survive reloads and restarts and are shared by every worker process
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Protocol
+
+import orjson
+from cachetools import TTLCache
+
+# Redis is optional: only needed when REDIS_URL is set
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    """Key/value store with per-entry expiry; values must be JSON-serializable."""
+
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+
+class SQLiteBackend:
+    """
+    Cache stored in a local SQLite file.
+
+    WAL mode lets several worker processes on the same host read and write the
+    file concurrently. Expired rows are skipped on read and purged periodically.
+    """
+
+    PURGE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path: str = "cache.db"):
+        """
+        Open (or create) the cache database
+
+        Args:
+            path: SQLite file path
+        """
+        # Caching is best-effort: a write that finds the file locked gives up after
+        # a second rather than holding up the request
+        self._conn = sqlite3.connect(path, timeout=1, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # One connection is shared by the worker threads that read and write it
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, orjson.dumps(value), now + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+
+class RedisBackend:
+    """Cache stored in Redis; shared across hosts as well as worker processes."""
+
+    def __init__(self, url: str):
+        """
+        Connect to Redis
+
+        Args:
+            url: Redis URL, e.g. redis://localhost:6379/0
+        """
+        if redis is None:
+            raise ImportError("redis package is not installed (pip install redis)")
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(key)
+        return orjson.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._client.set(key, orjson.dumps(value), ex=max(1, int(ttl)))
+
+
+def create_cache_backend() -> Optional[CacheBackend]:
+    """
+    Build the persistent cache backend from the environment
+
+    REDIS_URL selects Redis (shared by every Gunicorn worker and host);
+    otherwise entries go to the SQLite file at CACHE_DB_PATH (default cache.db).
+    CACHE_BACKEND=memory keeps the caches in-process only.
+
+    Returns:
+        The backend, or None for in-process caching (also on setup errors)
+    """
+    if os.getenv("CACHE_BACKEND", "").lower() == "memory":
+        return None
+    try:
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            backend = RedisBackend(redis_url)
+            logger.info("✓ Cache backend: Redis")
+        else:
+            backend = SQLiteBackend(os.getenv("CACHE_DB_PATH", "cache.db"))
+            logger.info("✓ Cache backend: SQLite")
+        return backend
+    except Exception as e:
+        logger.warning("⚠️  Persistent cache unavailable, caching in-process only: %s", e)
+        return None
+
+
+class SharedTTLCache:
+    """
+    TTL cache namespaced under a key prefix in a persistent backend.
+
+    Supports the get() / item assignment subset of TTLCache used by the callers;
+    coroutines use aget() / aset(), which run the backend I/O on a worker thread.
+    Without a backend it is a plain in-process TTLCache. Caching is best-effort:
+    backend errors are logged and treated as misses.
+    """
+
+    def __init__(self, prefix: str, ttl: float, maxsize: int = 1024, backend: Optional[CacheBackend] = None):
+        """
+        Initialize the cache
+
+        Args:
+            prefix: Namespace for this cache's keys in the backend (e.g. "search")
+            ttl: Seconds an entry stays valid
+            maxsize: Entry limit for the in-process fallback
+            backend: Persistent backend; None caches in-process
+        """
+        self.prefix = prefix
+        self.ttl = ttl
+        self.backend = backend
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl) if backend is None else None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self._local is not None:
+            return self._local.get(key, default)
+        try:
+            value = self.backend.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            logger.warning("⚠️  Cache read failed (%s): %s", self.prefix, e)
+            return default
+        return default if value is None else value
+
+    def __setitem__(self, key: str, value: Any):
+        if self._local is not None:
+            self._local[key] = value
+            return
+        try:
+            self.backend.set(f"{self.prefix}:{key}", value, self.ttl)
+        except Exception as e:
+            logger.warning("⚠️  Cache write failed (%s): %s", self.prefix, e)
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """get() for async callers; the backend is read off the event loop"""
+        if self._local is not None:
+            return self._local.get(key, default)
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key: str, value: Any):
+        """Item assignment for async callers; the backend is written off the event loop"""
+        if self._local is not None:
+            self._local[key] = value
+            return
+        await asyncio.to_thread(self.__setitem__, key, value)
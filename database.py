@@ -1,12 +1,40 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
 
+# Sessions are used from worker threads (asyncio.to_thread). A connection that
+# finds the database locked by another writer waits up to 5 s (SQLite busy
+# timeout) instead of failing with "database is locked". Under WAL there is one
+# writer at a time but readers never wait, so the pool holds enough connections
+# for the to_thread readers of a worker process.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 5},
+    pool_size=10,
+    max_overflow=5
 )
+
+# Applied to every new SQLite connection: WAL lets reads proceed while a write
+# commits, NORMAL sync is safe under WAL, and a larger cache / mmap keep the hot
+# conversations and chats pages in memory
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",    # 64 MB
+    "PRAGMA foreign_keys=ON",
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
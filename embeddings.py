@@ -4,15 +4,37 @@ Embedding Service for RAG with Pinecone
 Handles text embeddings and vector storage for chat personalization
 """
 
+import hashlib
 import os
+import re
+import threading
+from array import array
 from datetime import datetime
 from typing import List, Dict, Optional
+from cachetools import LRUCache
 from openai import OpenAI
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Meta-questions about search history ("what did I search for before?"), matched
+# anywhere in a message, case-insensitively
+META_QUESTION_RE = re.compile(r"previously|before|searched for|what did i", re.IGNORECASE)
+
+# Characters of a message that are embedded (about 500 tokens): the start of a
+# chat message carries its meaning, and the rest only adds billed tokens
+EMBED_MAX_CHARS = 2000
+
+# Recent embeddings kept per process. Each entry is a 32-byte digest and a
+# float32 array (1536 x 4 bytes = 6 KB), so the cache stays around 6 MB
+EMBEDDING_CACHE_SIZE = 1024
+
+
+def _embedding_key(text: str) -> bytes:
+    """Cache key for an (already truncated) text: its SHA-256 digest"""
+    return hashlib.sha256(text.encode()).digest()
+
 
 class EmbeddingService:
     """
@@ -33,8 +55,32 @@ class EmbeddingService:
         self.index_name = "chat-history"
         self.index = self.pc.Index(self.index_name)
         
+        # Recent embeddings by text digest: a chat message is embedded for the RAG
+        # query and again when the turn is stored, and repeated queries recur
+        # across users. Vectors are kept as compact float32 arrays.
+        self._embedding_cache = LRUCache(maxsize=EMBEDDING_CACHE_SIZE)
+        self._embedding_lock = threading.Lock()  # Used from several worker threads
+        
         print(f"✓ Embedding Service initialized (Index: {self.index_name})")
     
+    @staticmethod
+    def namespace_for(user_id: int) -> str:
+        """
+        Pinecone namespace holding a user's vectors
+        
+        Each user gets their own namespace, so a RAG query searches only that
+        user's messages instead of filtering the whole index. Vectors written
+        before namespacing live in the default namespace; run
+        migrate_pinecone_namespaces.py once to copy them over.
+        
+        Args:
+            user_id: User ID
+            
+        Returns:
+            Namespace name
+        """
+        return f"user_{user_id}"
+    
     def embed_text(self, text: str) -> List[float]:
         """
         Generate embedding vector for text
@@ -45,15 +91,62 @@ class EmbeddingService:
         Returns:
             List of 1536 floats representing the embedding
         """
+        text = text[:EMBED_MAX_CHARS]
+        key = _embedding_key(text)
+        with self._embedding_lock:
+            cached = self._embedding_cache.get(key)
+        if cached is not None:
+            return cached.tolist()
+        
         try:
             response = self.openai_client.embeddings.create(
                 model="text-embedding-3-small",
                 input=text
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
         except Exception as e:
             print(f"✗ Error generating embedding: {e}")
             return []
+        
+        with self._embedding_lock:
+            self._embedding_cache[key] = array("f", embedding)
+        return embedding
+    
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embedding vectors for several texts in one API request
+        
+        Args:
+            texts: Texts to embed (must be non-empty strings)
+            
+        Returns:
+            One embedding per text, in input order (empty list on error)
+        """
+        texts = [text[:EMBED_MAX_CHARS] for text in texts]
+        keys = [_embedding_key(text) for text in texts]
+        
+        # Only texts not embedded recently go to the API
+        with self._embedding_lock:
+            cached = [self._embedding_cache.get(key) for key in keys]
+        embeddings = [vector.tolist() if vector is not None else None for vector in cached]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if not missing:
+            return embeddings
+        
+        try:
+            response = self.openai_client.embeddings.create(
+                model="text-embedding-3-small",
+                input=missing
+            )
+            fetched = dict(zip(missing, (item.embedding for item in sorted(response.data, key=lambda item: item.index))))
+        except Exception as e:
+            print(f"✗ Error generating embeddings: {e}")
+            return []
+        
+        with self._embedding_lock:
+            for text, embedding in fetched.items():
+                self._embedding_cache[_embedding_key(text)] = array("f", embedding)
+        return [embedding if embedding is not None else fetched[text] for text, embedding in zip(texts, embeddings)]
     
     def store_message(
         self, 
@@ -100,11 +193,14 @@ class EmbeddingService:
                 vector_metadata.update(metadata)
             
             # Upsert to Pinecone
-            self.index.upsert(vectors=[{
-                "id": vector_id,
-                "values": embedding,
-                "metadata": vector_metadata
-            }])
+            self.index.upsert(
+                vectors=[{
+                    "id": vector_id,
+                    "values": embedding,
+                    "metadata": vector_metadata
+                }],
+                namespace=self.namespace_for(user_id)
+            )
             
             return True
             
@@ -112,6 +208,58 @@ class EmbeddingService:
             print(f"✗ Error storing message in Pinecone: {e}")
             return False
     
+    def store_messages_batch(self, messages: List[Dict]) -> int:
+        """
+        Store several messages with one embedding request and one Pinecone upsert
+        
+        Args:
+            messages: Dicts with user_id, conversation_id, message and role keys
+                (plus optional metadata), as for store_message. Keep batches
+                around 100 messages so the upsert stays under Pinecone's
+                request size limit.
+            
+        Returns:
+            Number of messages stored (0 on error)
+        """
+        # The embeddings API rejects empty strings
+        messages = [m for m in messages if m["message"].strip()]
+        if not messages:
+            return 0
+        
+        try:
+            embeddings = self.embed_texts([m["message"] for m in messages])
+            if not embeddings:
+                return 0
+            
+            timestamp = datetime.now().isoformat()
+            vectors_by_user: Dict[int, List[Dict]] = {}
+            for i, (msg, embedding) in enumerate(zip(messages, embeddings)):
+                vector_metadata = {
+                    "user_id": msg["user_id"],
+                    "conversation_id": msg["conversation_id"],
+                    "message": msg["message"][:1000],  # Limit message length in metadata
+                    "role": msg["role"],
+                    "timestamp": timestamp
+                }
+                if msg.get("metadata"):
+                    vector_metadata.update(msg["metadata"])
+                
+                # The batch shares one timestamp, so the position keeps IDs unique
+                vectors_by_user.setdefault(msg["user_id"], []).append({
+                    "id": f"user_{msg['user_id']}_conv_{msg['conversation_id']}_{timestamp}_{i}",
+                    "values": embedding,
+                    "metadata": vector_metadata
+                })
+            
+            # One upsert per user namespace (a single one outside the backfill)
+            for user_id, vectors in vectors_by_user.items():
+                self.index.upsert(vectors=vectors, namespace=self.namespace_for(user_id))
+            return len(messages)
+            
+        except Exception as e:
+            print(f"✗ Error storing messages in Pinecone: {e}")
+            return 0
+    
     def search_similar(
         self, 
         user_id: int, 
@@ -137,17 +285,20 @@ class EmbeddingService:
             if not query_embedding:
                 return []
             
-            # Build filter
+            # Build filter (the namespace already scopes the query to the user;
+            # the user_id filter is kept as a safeguard)
             filter_dict = {"user_id": user_id}
             if filter_metadata:
                 filter_dict.update(filter_metadata)
             
-            # Query Pinecone
+            # Query Pinecone (metadata only: the vectors themselves aren't used)
             results = self.index.query(
                 vector=query_embedding,
                 top_k=top_k,
+                namespace=self.namespace_for(user_id),
                 filter=filter_dict,
-                include_metadata=True
+                include_metadata=True,
+                include_values=False
             )
             
             # Extract matches
@@ -179,8 +330,10 @@ class EmbeddingService:
         Returns:
             Formatted context string for AI prompt
         """
-        # Search for similar past messages
-        similar_messages = self.search_similar(user_id, query, top_k=10)  # Get more results
+        # Search for similar past messages. Only the user's own messages are used,
+        # so Pinecone filters on role and returns no assistant replies to discard
+        # (5 user messages cover what 10 mixed ones did)
+        similar_messages = self.search_similar(user_id, query, top_k=5, filter_metadata={"role": "user"})
         
         if not similar_messages:
             return ""
@@ -190,25 +343,21 @@ class EmbeddingService:
         seen_products = set()
         
         for msg in similar_messages:
-            message_text = msg['message'].lower()
-            
             # Skip meta-questions about search history
-            if any(word in message_text for word in ['previously', 'before', 'searched for', 'what did i']):
+            if META_QUESTION_RE.search(msg['message']):
                 continue
             
             # Extract product mentions (simple keyword extraction)
             # Look for product names, colors, storage sizes, etc.
-            if msg['role'] == 'user' or 'FINAL_QUERY' in msg['message']:
-                # Clean up the message
-                clean_msg = msg['message'].replace('FINAL_QUERY:', '').strip()
-                
-                # Only add if it's substantive (not a meta-question)
-                if len(clean_msg) > 5 and clean_msg not in seen_products:
-                    products_mentioned.append({
-                        'text': clean_msg[:150],
-                        'role': msg['role']
-                    })
-                    seen_products.add(clean_msg)
+            clean_msg = msg['message'].strip()
+            
+            # Only add if it's substantive (not a meta-question)
+            if len(clean_msg) > 5 and clean_msg not in seen_products:
+                products_mentioned.append({
+                    'text': clean_msg[:150],
+                    'role': msg['role']
+                })
+                seen_products.add(clean_msg)
         
         if not products_mentioned:
             return ""
@@ -10,12 +10,33 @@ import './App.css'
 
 const API_URL = 'http://127.0.0.1:8000'
 
+// Read a newline-delimited JSON response body, calling onEvent for each line
+const readNdjson = async (response, onEvent) => {
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    buffer += decoder.decode(value || new Uint8Array(), { stream: !done })
+    let newline
+    while ((newline = buffer.indexOf('\n')) !== -1) {
+      const line = buffer.slice(0, newline).trim()
+      buffer = buffer.slice(newline + 1)
+      if (line) onEvent(JSON.parse(line))
+    }
+    if (done) break
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer))
+}
+
 // Create a wrapper component to use the auth hook
 const ChatApp = () => {
   const { user, token, logout, loading } = useAuth();
   const [messages, setMessages] = useState([])
   const [input, setInput] = useState('')
   const [isLoading, setIsLoading] = useState(false)
+  const [loadingStatus, setLoadingStatus] = useState(null)  // progress text from /chat/stream
+  const [streamingText, setStreamingText] = useState('')    // reply text streamed so far
   const [results, setResults] = useState(null)
   const [conversations, setConversations] = useState([])
   const [currentConversationId, setCurrentConversationId] = useState(null)
@@ -257,28 +278,54 @@ const ChatApp = () => {
         payload.image_data = currentImageBase64
       }
 
-      const response = await axios.post(
-        `${API_URL}/chat`,
-        payload,
-        { headers: { Authorization: `Bearer ${token}` } }
-      )
+      // Stream the reply: status lines arrive while the backend verifies and
+      // searches, then a final line carries the full chat response
+      const response = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${token}`
+        },
+        body: JSON.stringify(payload)
+      })
+      if (!response.ok) {
+        const error = new Error(`Chat request failed: ${response.status}`)
+        error.response = { status: response.status }
+        throw error
+      }
+
+      let data = null
+      await readNdjson(response, (event) => {
+        if (event.event === 'delta') {
+          setStreamingText(prev => prev + event.text)
+        } else if (event.event === 'status') {
+          setLoadingStatus(event.message)
+        } else if (event.event === 'response') {
+          data = event.data
+        } else if (event.event === 'error') {
+          const error = new Error(event.detail)
+          error.response = { status: event.status }
+          throw error
+        }
+      })
+      if (!data) throw new Error('Chat stream ended without a response')
 
       // Add assistant response
       setMessages([...newMessages, {
         role: 'assistant',
-        content: response.data.message,
-        a2ui_content: response.data.a2ui_content
+        content: data.message,
+        a2ui_content: data.a2ui_content
       }])
 
       // Update conversation ID if it was a new chat
-      if (!currentConversationId && response.data.conversation_id) {
-        setCurrentConversationId(response.data.conversation_id);
+      if (!currentConversationId && data.conversation_id) {
+        setCurrentConversationId(data.conversation_id);
         fetchConversations(); // Refresh list to show new title
       }
 
       // If we got results, display them
-      if (response.data.type === 'results' && response.data.results) {
-        setResults(response.data.results)
+      if (data.type === 'results' && data.results) {
+        setResults(data.results)
       }
 
     } catch (error) {
@@ -293,6 +340,8 @@ const ChatApp = () => {
       }
     } finally {
       setIsLoading(false)
+      setLoadingStatus(null)
+      setStreamingText('')
     }
   }
 
@@ -402,12 +451,20 @@ const ChatApp = () => {
                     </div>
                   </div>
                 ))}
-                {isLoading && (
+                {isLoading && streamingText && (
+                  <div className="message assistant">
+                    <div className="message-content">
+                      <ReactMarkdown>{streamingText}</ReactMarkdown>
+                    </div>
+                  </div>
+                )}
+                {isLoading && !streamingText && (
                   <div className="message assistant">
                     <div className="message-content loading">
                       <span className="dot"></span>
                       <span className="dot"></span>
                       <span className="dot"></span>
+                      {loadingStatus && <span className="loading-status">{loadingStatus}</span>}
                     </div>
                   </div>
                 )}
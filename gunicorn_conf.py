@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Gunicorn configuration for production deployments
+Runs the FastAPI app in several Uvicorn worker processes, one event loop per core.
+
+Usage:
+    gunicorn api_mcp:app -c gunicorn_conf.py
+"""
+
+import os
+import multiprocessing
+
+# --- Server Socket ---
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+
+# --- Worker Processes ---
+# Classic 2n+1 sizing; WEB_CONCURRENCY overrides it (e.g. on small containers)
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 * multiprocessing.cpu_count() + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# /chat waits on OpenRouter, the Research Agent and both marketplaces, so allow
+# slow requests to finish before a worker is considered hung
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# --- Logging ---
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
@@ -6,7 +6,7 @@ Manages connections to MCP servers
 
 import asyncio
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
@@ -16,7 +16,7 @@ class MCPClientManager:
     
     def __init__(self):
         self.sessions = {}
-        self.clients = {}
+        self.clients = {}  # server name -> (connection task, stop event)
     
     async def connect_server(self, server_name: str, command: str, args: list, env: Optional[Dict] = None):
         """Connect to an MCP server"""
@@ -26,19 +26,33 @@ class MCPClientManager:
             env=env or {}
         )
         
-        # Use stdio_client as async context manager
-        stdio_transport = stdio_client(server_params)
-        read_stream, write_stream = await stdio_transport.__aenter__()
+        # The transport and session are context managers that must be exited by
+        # the task that entered them, so each connection lives in its own task
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        task = asyncio.create_task(self._hold_connection(server_params, ready, stop))
+        session = await ready
         
-        self.clients[server_name] = stdio_transport
-        
-        session = ClientSession(read_stream, write_stream)
-        await session.initialize()
+        self.clients[server_name] = (task, stop)
         self.sessions[server_name] = session
         
         print(f"✓ Connected to {server_name} MCP server")
         return session
     
+    @staticmethod
+    async def _hold_connection(server_params: StdioServerParameters, ready: asyncio.Future, stop: asyncio.Event):
+        """Open a server connection, hand its session to connect_server, and close it once stopped."""
+        try:
+            async with stdio_client(server_params) as (read_stream, write_stream):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await stop.wait()
+        except BaseException as e:
+            if ready.done():
+                raise
+            ready.set_exception(e)
+    
     async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """Call a tool on a specific MCP server"""
         if server_name not in self.sessions:
@@ -58,11 +72,35 @@ class MCPClientManager:
         
         return None
     
+    async def call_tools_parallel(self, calls: List[Tuple[str, str, Dict[str, Any]]], max_concurrency: int = 8) -> List[Any]:
+        """
+        Call several tools concurrently
+        
+        Args:
+            calls: (server_name, tool_name, arguments) for each call
+            max_concurrency: Most calls in flight at once
+        
+        Returns:
+            One result per call, in order; a failed call gives its exception
+        """
+        slots = asyncio.Semaphore(max_concurrency)
+        
+        async def limited(server_name: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
+            async with slots:
+                return await self.call_tool(server_name, tool_name, arguments)
+        
+        return await asyncio.gather(
+            *(limited(*call) for call in calls),
+            return_exceptions=True
+        )
+    
     async def close_all(self):
-        """Close all MCP server connections"""
-        for server_name, session in self.sessions.items():
+        """Close all MCP server connections (ending their subprocesses)"""
+        # Newest first; each task exits its session and transport contexts
+        for server_name, (task, stop) in reversed(list(self.clients.items())):
+            stop.set()
             try:
-                await session.close()
+                await task
                 print(f"✓ Closed {server_name} connection")
             except Exception as e:
                 print(f"⚠️  Error closing {server_name}: {e}")
@@ -85,38 +123,48 @@ async def initialize_mcp_clients():
     
     mcp_manager = MCPClientManager()
     
-    # Connect to Research Agent
+    # (server name, script, env) for each server to start
+    servers = []
+    
+    # Research Agent
     if os.environ.get("SERPER_API_KEY"):
-        await mcp_manager.connect_server(
+        servers.append((
             "research-agent",
-            "python3",
-            ["mcp_servers/research_server.py"],
-            env={
+            "mcp_servers/research_server.py",
+            {
                 "RESEARCH_AGENT_API_KEY": os.environ.get("RESEARCH_AGENT_API_KEY") or os.environ.get("OPENROUTER_API_KEY"),
                 "SERPER_API_KEY": os.environ.get("SERPER_API_KEY")
             }
-        )
+        ))
     
-    # Connect to eBay Search
-    await mcp_manager.connect_server(
+    # eBay Search
+    servers.append((
         "ebay-search",
-        "python3",
-        ["mcp_servers/ebay_server.py"],
-        env={
+        "mcp_servers/ebay_server.py",
+        {
             "EBAY_CLIENT_ID": os.environ.get("EBAY_CLIENT_ID"),
             "EBAY_CLIENT_SECRET": os.environ.get("EBAY_CLIENT_SECRET")
         }
-    )
+    ))
     
-    # Connect to Amazon Search
-    await mcp_manager.connect_server(
+    # Amazon Search
+    servers.append((
         "amazon-search",
-        "python3",
-        ["mcp_servers/amazon_server.py"],
-        env={
+        "mcp_servers/amazon_server.py",
+        {
             "RAINFOREST_API_KEY": os.environ.get("RAINFOREST_API_KEY")
         }
+    ))
+    
+    # Start the servers concurrently, so startup takes as long as the slowest one
+    # rather than the sum; a server that fails to start doesn't stop the others
+    results = await asyncio.gather(
+        *(mcp_manager.connect_server(name, "python3", [script], env=env) for name, script, env in servers),
+        return_exceptions=True
     )
+    for (name, _, _), result in zip(servers, results):
+        if isinstance(result, BaseException):
+            print(f"⚠️  Could not connect to {name} MCP server: {result}")
     
     return mcp_manager
 
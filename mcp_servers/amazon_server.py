@@ -6,8 +6,13 @@ Provides Amazon product search functionality via Rainforest API
 
 import os
 import sys
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+import httpx
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
@@ -20,15 +25,38 @@ from agents import RainforestSearch
 
 load_dotenv()
 
-# Initialize FastAPI
-app = FastAPI(title="Amazon Search MCP Server")
-
 # Initialize Amazon Search
 RAINFOREST_API_KEY = os.environ.get("RAINFOREST_API_KEY")
 
-print("Initializing Rainforest API...")
-amazon = RainforestSearch(RAINFOREST_API_KEY)
-print("✓ Amazon Search initialized")
+# Built per worker process in lifespan; with several workers the supervisor
+# process also imports this module but never serves a request
+http_client: Optional[httpx.AsyncClient] = None
+amazon: Optional[RainforestSearch] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up the Rainforest client and connection pool; release them on shutdown."""
+    global http_client, amazon
+    print("Initializing Rainforest API...")
+    amazon = RainforestSearch(RAINFOREST_API_KEY)
+    print("✓ Amazon Search initialized")
+    # Pooled keep-alive connections to the Rainforest API, shared by all requests;
+    # HTTP/2 multiplexes concurrent searches over a few connections
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(20.0, connect=5.0),
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=20)
+    )
+    yield
+    await http_client.aclose()
+    amazon.close()
+
+# Initialize FastAPI
+app = FastAPI(lifespan=lifespan, title="Amazon Search MCP Server", default_response_class=ORJSONResponse)  # orjson for every JSON response
+# Gzip the search results (4 products with titles and image URLs) for clients
+# that accept it; level 5 keeps the CPU cost low, and small bodies such as
+# health checks are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
 
 
 # Request/Response Models
@@ -55,25 +83,44 @@ async def health_check():
     return {"status": "healthy", "service": "amazon-search"}
 
 
+# Shared read-only stand-in for missing nested objects in search payloads
+_EMPTY = MappingProxyType({})
+
 @app.post("/search", response_model=SearchResponse)
 async def search_amazon(request: SearchRequest):
     """Search for products on Amazon"""
-    amazon_data = amazon.search_items(request.query)
+    # Async HTTP, so concurrent searches overlap on the event loop
+    amazon_data = await amazon.search_items_async(request.query, http_client, top_n=4)
     
+    # Fields are plain strings (or None) read from the upstream JSON, so the results
+    # are built as dicts and returned directly: a returned Response skips FastAPI's
+    # response model validation (SearchResponse still documents the schema)
     results = []
     if amazon_data and "search_results" in amazon_data:
-        for item in amazon_data["search_results"][:4]:
-            results.append(ProductResult(
-                title=item.get("title"),
-                price=item.get("price", {}).get("raw"),
-                rating=f"{item.get('rating')} stars ({item.get('ratings_total')} reviews)" if item.get('rating') else None,
-                url=item.get("link"),
-                image_url=item.get("image")
-            ))
+        results = [
+            {
+                "title": item.get("title"),
+                "price": (item.get("price") or _EMPTY).get("raw"),
+                "rating": f"{rating} stars ({item.get('ratings_total')} reviews)" if (rating := item.get("rating")) else None,
+                "url": item.get("link"),
+                "image_url": item.get("image")
+            }
+            for item in amazon_data["search_results"][:4]
+        ]
     
-    return SearchResponse(results=results, count=len(results))
-
+    return ORJSONResponse({"results": results, "count": len(results)})
 
 if __name__ == "__main__":
     print("🛒 Starting Amazon Search HTTP Server on port 8003...")
-    uvicorn.run(app, host="127.0.0.1", port=8003)
+    # Several worker processes with uvloop/httptools; workers need the app as an
+    # import string (this directory is on sys.path, which the workers inherit)
+    uvicorn.run(
+        "amazon_server:app",
+        host="127.0.0.1",
+        port=8003,
+        workers=int(os.getenv("MCP_WORKERS", "2")),
+        loop="uvloop",
+        http="httptools",
+        ws="none",  # Pure HTTP API; skip loading a WebSocket implementation
+        log_level="warning"
+    )
@@ -4,10 +4,16 @@ eBay Search Agent - HTTP Server
 Provides eBay product search functionality
 """
 
+import asyncio
 import os
 import sys
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+import httpx
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
@@ -20,17 +26,40 @@ from agents import eBaySearch
 
 load_dotenv()
 
-# Initialize FastAPI
-app = FastAPI(title="eBay Search MCP Server")
-
 # Initialize eBay Search
 EBAY_CLIENT_ID = os.environ.get("EBAY_CLIENT_ID")
 EBAY_CLIENT_SECRET = os.environ.get("EBAY_CLIENT_SECRET")
 
-print("Authenticating with eBay API...")
-ebay = eBaySearch(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET)
-ebay.get_access_token()
-print("✓ eBay Search initialized")
+# Built per worker process in lifespan; with several workers the supervisor
+# process also imports this module but never serves a request
+http_client: Optional[httpx.AsyncClient] = None
+ebay: Optional[eBaySearch] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up the eBay client and connection pool; release them on shutdown."""
+    global http_client, ebay
+    print("Authenticating with eBay API...")
+    ebay = eBaySearch(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET)
+    await asyncio.to_thread(ebay.get_access_token)
+    print("✓ eBay Search initialized")
+    # Pooled keep-alive connections to the eBay API, shared by all requests;
+    # HTTP/2 multiplexes concurrent searches over a few connections
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(20.0, connect=5.0),
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=20)
+    )
+    yield
+    await http_client.aclose()
+    ebay.close()
+
+# Initialize FastAPI
+app = FastAPI(lifespan=lifespan, title="eBay Search MCP Server", default_response_class=ORJSONResponse)  # orjson for every JSON response
+# Gzip the search results (4 products with titles and image URLs) for clients
+# that accept it; level 5 keeps the CPU cost low, and small bodies such as
+# health checks are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
 
 
 # Request/Response Models
@@ -58,25 +87,44 @@ async def health_check():
     return {"status": "healthy", "service": "ebay-search"}
 
 
+# Shared read-only stand-in for missing nested objects in search payloads
+_EMPTY = MappingProxyType({})
+
 @app.post("/search", response_model=SearchResponse)
 async def search_ebay(request: SearchRequest):
     """Search for products on eBay"""
-    ebay_data = ebay.search_items(request.query, limit=request.limit)
+    # Async HTTP, so concurrent searches overlap on the event loop
+    ebay_data = await ebay.search_items_async(request.query, http_client, limit=request.limit)
     
+    # Fields are plain strings (or None) read from the upstream JSON, so the results
+    # are built as dicts and returned directly: a returned Response skips FastAPI's
+    # response model validation (SearchResponse still documents the schema)
     results = []
     if ebay_data and "itemSummaries" in ebay_data:
-        for item in ebay_data["itemSummaries"][:request.limit]:
-            results.append(ProductResult(
-                title=item.get("title"),
-                price=f"{item.get('price', {}).get('value')} {item.get('price', {}).get('currency')}",
-                condition=item.get("condition"),
-                url=item.get("itemWebUrl"),
-                image_url=item.get("image", {}).get("imageUrl")
-            ))
+        results = [
+            {
+                "title": item.get("title"),
+                "price": f"{(price := item.get('price') or _EMPTY).get('value')} {price.get('currency')}",
+                "condition": item.get("condition"),
+                "url": item.get("itemWebUrl"),
+                "image_url": (item.get("image") or _EMPTY).get("imageUrl")
+            }
+            for item in ebay_data["itemSummaries"][:request.limit]
+        ]
     
-    return SearchResponse(results=results, count=len(results))
-
+    return ORJSONResponse({"results": results, "count": len(results)})
 
 if __name__ == "__main__":
     print("🛒 Starting eBay Search HTTP Server on port 8002...")
-    uvicorn.run(app, host="127.0.0.1", port=8002)
+    # Several worker processes with uvloop/httptools; workers need the app as an
+    # import string (this directory is on sys.path, which the workers inherit)
+    uvicorn.run(
+        "ebay_server:app",
+        host="127.0.0.1",
+        port=8002,
+        workers=int(os.getenv("MCP_WORKERS", "2")),
+        loop="uvloop",
+        http="httptools",
+        ws="none",  # Pure HTTP API; skip loading a WebSocket implementation
+        log_level="warning"
+    )
@@ -6,10 +6,14 @@ Provides product verification via web search
 
 import os
 import sys
+from contextlib import asynccontextmanager
+import httpx
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # Add parent directory to path to import agents
@@ -17,22 +21,53 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import the research agent
 from agents import ResearchAgent
+from agents.research_agent import VERIFICATION_CACHE_TTL
+from cache_backend import create_cache_backend, SharedTTLCache
 
 load_dotenv()
 
-# Initialize FastAPI
-app = FastAPI(title="Research Agent MCP Server")
-
 # Initialize Research Agent
 OPENROUTER_API_KEY = os.environ.get("RESEARCH_AGENT_API_KEY") or os.environ.get("OPENROUTER_API_KEY")
 SERPER_API_KEY = os.environ.get("SERPER_API_KEY")
 
-if not SERPER_API_KEY:
-    print("⚠️  SERPER_API_KEY not found - Research Agent will not work")
-    research_agent = None
-else:
-    research_agent = ResearchAgent(OPENROUTER_API_KEY, SERPER_API_KEY)
-    print("✓ Research Agent initialized")
+# Built per worker process in lifespan; with several workers the supervisor
+# process also imports this module but never serves a request
+http_client: Optional[httpx.AsyncClient] = None
+research_agent: Optional[ResearchAgent] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up the research agent and connection pool; release them on shutdown."""
+    global http_client, research_agent
+    if not SERPER_API_KEY:
+        print("⚠️  SERPER_API_KEY not found - Research Agent will not work")
+    else:
+        # Verdicts persist across restarts (Redis or SQLite; see cache_backend.py)
+        research_agent = ResearchAgent(
+            OPENROUTER_API_KEY,
+            SERPER_API_KEY,
+            verification_cache=SharedTTLCache(
+                "research", VERIFICATION_CACHE_TTL, backend=create_cache_backend()
+            )
+        )
+        print("✓ Research Agent initialized")
+    # Pooled keep-alive connections to Serper, shared by all verifications
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(20.0, connect=5.0),
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=20)
+    )
+    yield
+    await http_client.aclose()
+    if research_agent:
+        research_agent.close()
+        await research_agent.aclose()
+
+# Initialize FastAPI
+app = FastAPI(lifespan=lifespan, title="Research Agent MCP Server", default_response_class=ORJSONResponse)  # orjson for every JSON response
+# Gzip long verdicts for clients that accept it; level 5 keeps the CPU cost
+# low, and small bodies (most verdicts, health checks) are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
 
 
 # Request/Response Models
@@ -47,6 +82,23 @@ class VerifyProductResponse(BaseModel):
     release_status: str
 
 
+def _to_response(result: Dict) -> VerifyProductResponse:
+    return VerifyProductResponse(
+        exists=result.get("exists", False),
+        info=result.get("info", ""),
+        confidence=result.get("confidence", "low"),
+        release_status=result.get("release_status", "unknown")
+    )
+
+
+_AGENT_UNAVAILABLE = VerifyProductResponse(
+    exists=False,
+    info="Research agent not available - SERPER_API_KEY missing",
+    confidence="low",
+    release_status="unknown"
+)
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -57,23 +109,25 @@ async def health_check():
 async def verify_product(request: VerifyProductRequest):
     """Verify if a product exists and is currently available"""
     if not research_agent:
-        return VerifyProductResponse(
-            exists=False,
-            info="Research agent not available - SERPER_API_KEY missing",
-            confidence="low",
-            release_status="unknown"
-        )
+        return _AGENT_UNAVAILABLE
     
-    result = research_agent.verify_product(request.product_name)
+    # Async Serper and LLM calls, so concurrent verifications overlap on the event loop
+    result = await research_agent.verify_product_async(request.product_name, http_client)
     
-    return VerifyProductResponse(
-        exists=result.get("exists", False),
-        info=result.get("info", ""),
-        confidence=result.get("confidence", "low"),
-        release_status=result.get("release_status", "unknown")
-    )
+    return _to_response(result)
 
 
 if __name__ == "__main__":
     print("🔍 Starting Research Agent HTTP Server on port 8001...")
-    uvicorn.run(app, host="127.0.0.1", port=8001)
+    # Several worker processes with uvloop/httptools; workers need the app as an
+    # import string (this directory is on sys.path, which the workers inherit)
+    uvicorn.run(
+        "research_server:app",
+        host="127.0.0.1",
+        port=8001,
+        workers=int(os.getenv("MCP_WORKERS", "2")),
+        loop="uvloop",
+        http="httptools",
+        ws="none",  # Pure HTTP API; skip loading a WebSocket implementation
+        log_level="warning"
+    )
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+One-shot migration: Add the composite indexes for conversation listing and history.
+Run this once to update an existing app.db (new databases get them from create_all).
+Safe to run multiple times — the indexes are only created if missing.
+"""
+
+import sqlite3
+import os
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "app.db")
+
+INDEXES = {
+    "ix_conv_user_created": "CREATE INDEX IF NOT EXISTS ix_conv_user_created ON conversations (user_id, created_at DESC)",
+    "ix_chat_conv_ts": "CREATE INDEX IF NOT EXISTS ix_chat_conv_ts ON chats (conversation_id, timestamp)",
+}
+
+def migrate():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    for name, statement in INDEXES.items():
+        print(f"Ensuring index '{name}'...")
+        cursor.execute(statement)
+
+    # Refresh planner statistics so the new indexes are picked up
+    cursor.execute("ANALYZE")
+    conn.commit()
+    print("✓ Migration complete.")
+
+    conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+One-shot migration: Move chat search results to the compressed results_z column.
+Run this once to update an existing app.db (new databases get the column from create_all).
+Safe to run multiple times — only rows still holding JSON text are converted.
+"""
+
+import sqlite3
+import os
+import zlib
+import orjson
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "app.db")
+
+def migrate():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    # Check which columns exist
+    cursor.execute("PRAGMA table_info(chats)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if "results_z" not in columns:
+        print("Adding 'results_z' column to 'chats' table...")
+        cursor.execute("ALTER TABLE chats ADD COLUMN results_z BLOB")
+
+    if "results" in columns:
+        # JSON 'null' (how the old column stored None) becomes SQL NULL
+        cursor.execute(
+            "SELECT id, results FROM chats WHERE results IS NOT NULL AND results != 'null'"
+        )
+        rows = [
+            (zlib.compress(orjson.dumps(orjson.loads(results)), 6), chat_id)
+            for chat_id, results in cursor.fetchall()
+        ]
+        print(f"Compressing results of {len(rows)} messages...")
+        cursor.executemany("UPDATE chats SET results_z = ? WHERE id = ?", rows)
+        cursor.execute("UPDATE chats SET results = NULL")
+        conn.commit()
+
+        # Drop the old column where SQLite supports it (3.35+); it is unused either way
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            print("Dropping old 'results' column...")
+            cursor.execute("ALTER TABLE chats DROP COLUMN results")
+        conn.commit()
+
+        # Reclaim the pages freed by the JSON text
+        cursor.execute("VACUUM")
+        print("✓ Migration complete.")
+    else:
+        conn.commit()
+        print("✓ Results already compressed. Nothing to do.")
+
+    conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+One-shot migration: Copy RAG vectors from Pinecone's default namespace into per-user namespaces.
+Run this once after upgrading; RAG only reads the user_<id> namespaces, so vectors
+stored before namespacing are invisible until copied.
+Safe to run multiple times — the stored embeddings are copied as-is (no embedding
+API calls) and upserting the same IDs again overwrites the earlier copies.
+"""
+
+from collections import defaultdict
+from embeddings import EmbeddingService
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_NAMESPACE = ""
+PAGE_SIZE = 100  # IDs per list page, fetch and upsert
+
+def migrate():
+    print("🔄 Copying default-namespace vectors into per-user namespaces...")
+    embedding_service = EmbeddingService()
+    index = embedding_service.index
+
+    copied_count = 0
+    skipped_count = 0
+
+    for page in index.list(namespace=DEFAULT_NAMESPACE, limit=PAGE_SIZE):
+        # Pages hold ID strings (older clients) or items with an id
+        ids = [getattr(item, "id", item) for item in page]
+        if not ids:
+            continue
+
+        fetched = index.fetch(ids=ids, namespace=DEFAULT_NAMESPACE).vectors
+        vectors_by_user = defaultdict(list)
+        for vector in fetched.values():
+            metadata = vector.metadata or {}
+            if metadata.get("user_id") is None:
+                skipped_count += 1
+                continue
+            # Pinecone returns numeric metadata as floats
+            vectors_by_user[int(metadata["user_id"])].append({
+                "id": vector.id,
+                "values": vector.values,
+                "metadata": metadata
+            })
+
+        for user_id, vectors in vectors_by_user.items():
+            index.upsert(vectors=vectors, namespace=embedding_service.namespace_for(user_id))
+            copied_count += len(vectors)
+        print(f"✓ Copied {copied_count} vectors...")
+
+    print("\n✅ Migration complete!")
+    print(f"   Copied: {copied_count}")
+    print(f"   Skipped (no user_id): {skipped_count}")
+    print("   The default namespace is no longer read; delete it once the copies are verified.")
+
+if __name__ == "__main__":
+    migrate()
@@ -1,8 +1,31 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+import zlib
+import orjson
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 from database import Base
 
+class CompressedJSON(TypeDecorator):
+    """JSON value stored as zlib-compressed orjson bytes (a BLOB in SQLite).
+
+    Search results are repetitive (titles, URLs, price strings) and compress
+    several times over, so chats take fewer database pages. None is stored as
+    SQL NULL.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zlib.compress(orjson.dumps(value), 6)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return orjson.loads(zlib.decompress(value))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -27,11 +50,19 @@ class Chat(Base):
     __tablename__ = "chats"
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"))
     role = Column(String)  # 'user' or 'assistant'
     message = Column(Text)
     image_data = Column(Text, nullable=True)  # Base64-encoded image data
-    results = Column(JSON, nullable=True)  # Store search results as JSON
+    # Search results; a new column, so rows saved as JSON text must be converted
+    # with migrate_compress_results.py
+    results = Column("results_z", CompressedJSON, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
     conversation = relationship("Conversation", back_populates="chats")
+
+# Composite indexes (see migrate_add_indexes.py for existing databases)
+# /conversations: a user's conversations, newest first, read in index order
+Index("ix_conv_user_created", Conversation.user_id, Conversation.created_at.desc())
+# /conversations/{id} and chat history: a conversation's messages in time order
+Index("ix_chat_conv_ts", Chat.conversation_id, Chat.timestamp)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Response Cache for LLM chat completions
+Reuses recent AI replies so repeated questions skip the OpenRouter round-trip
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from cachetools import TTLCache
+
+from cache_backend import CacheBackend, SharedTTLCache
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _hash_payload(payload: Any) -> str:
+    """Deterministic SHA-256 of a JSON-serializable payload."""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    """Scale a vector to unit length (empty if it has no magnitude)."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else []
+
+
+def _numbers(text: str) -> Tuple[str, ...]:
+    """Sorted number tokens of a message ("256GB" and "512GB" embed almost alike)."""
+    return tuple(sorted(_NUMBER_RE.findall(text)))
+
+
+class LLMCache:
+    """
+    Two-tier cache for chat completions.
+
+    1. Exact: the SHA-256 of (model, messages) - retries and reloads that replay
+       an identical request.
+    2. Semantic: the conversation context (model, system prompt and every
+       earlier message) is identical and the latest user message is
+       semantically near-identical (cosine similarity above the threshold), e.g.
+       "iphone 15 pro" vs "iPhone 15 Pro please". Restricting matches to the same
+       context keeps a cached follow-up question from leaking into a different
+       conversation. Both messages must also hold the same numbers, since
+       embeddings barely tell "256GB" from "512GB", and replies containing
+       semantic_exclude (e.g. a final search query) are only reused exactly.
+
+    Only the exact tier goes to the persistent backend. The semantic tier's
+    embeddings stay in-process: they are large, and scanning them means reading
+    every entry of a context, which is cheap in memory but not over I/O.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        maxsize: int = 10_000,
+        ttl: float = 3600,
+        similarity_threshold: float = 0.95,
+        max_entries_per_context: int = 32,
+        semantic_exclude: Optional[str] = None,
+        backend: Optional[CacheBackend] = None
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            embed_fn: Blocking text -> embedding function (run on a worker thread);
+                      the semantic tier is disabled without one
+            maxsize: Maximum number of cached requests (and conversation contexts)
+            ttl: Seconds a cached reply stays valid
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+            max_entries_per_context: Replies kept per context (oldest dropped first)
+            semantic_exclude: Replies containing this text skip the semantic tier
+            backend: Persistent backend for the exact tier; None caches in-process
+        """
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_context = max_entries_per_context
+        self.semantic_exclude = semantic_exclude
+        # request hash -> reply
+        self._exact = SharedTTLCache("llm:exact", ttl, maxsize=maxsize, backend=backend)
+        # context key -> [(unit embedding, number tokens, reply), ...]; per process
+        self._semantic = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _split(model: str, messages: List[Dict[str, Any]]) -> Tuple[str, Optional[str]]:
+        """
+        Split a request into its context key and the latest user text.
+
+        Returns:
+            (context_key, user_text); user_text is None when the last message
+            is not a plain-text user turn (e.g. it carries an image)
+        """
+        context_key = _hash_payload({"model": model, "messages": messages[:-1]})
+        last = messages[-1] if messages else {}
+        content = last.get("content")
+        if last.get("role") != "user" or not isinstance(content, str) or not content.strip():
+            return context_key, None
+        return context_key, content.strip()
+
+    async def _embed(self, text: str) -> List[float]:
+        try:
+            return _normalize(await asyncio.to_thread(self.embed_fn, text))
+        except Exception as e:
+            logger.warning("⚠️  Response cache embedding failed: %s", e)
+            return []
+
+    async def lookup(self, model: str, messages: List[Dict[str, Any]]) -> Tuple[Optional[str], Any]:
+        """
+        Look up a cached reply for a chat request
+
+        Args:
+            model: Model name
+            messages: Full message list sent to the model
+
+        Returns:
+            (reply, token): reply is None on a miss; pass token to store() so the
+            keys and embedding computed here are not recomputed
+        """
+        exact_key = _hash_payload({"model": model, "messages": messages})
+        reply = await self._exact.aget(exact_key)
+        if reply is not None:
+            logger.debug("⚡ Response cache hit (exact)")
+            return reply, None
+
+        if self.embed_fn is None:
+            return None, (exact_key, None, None, None)
+
+        context_key, user_text = self._split(model, messages)
+        if user_text is None:
+            return None, (exact_key, None, None, None)
+
+        embedding = await self._embed(user_text)
+        if not embedding:
+            return None, (exact_key, None, None, None)
+
+        numbers = _numbers(user_text)
+        best_score, best_reply = 0.0, None
+        for cached_embedding, cached_numbers, reply in self._semantic.get(context_key, ()):
+            if cached_numbers != numbers:
+                continue
+            score = sum(a * b for a, b in zip(embedding, cached_embedding))
+            if score > best_score:
+                best_score, best_reply = score, reply
+        if best_score >= self.similarity_threshold:
+            logger.debug("⚡ Response cache hit (semantic, similarity %.3f)", best_score)
+            return best_reply, None
+
+        return None, (exact_key, context_key, embedding, numbers)
+
+    async def store(self, token: Any, reply: str):
+        """
+        Cache a reply for the request that produced the given lookup token
+
+        Args:
+            token: Second value returned by lookup() on the miss
+            reply: The AI reply to cache
+        """
+        if token is None or not reply:
+            return
+        exact_key, context_key, embedding, numbers = token
+        await self._exact.aset(exact_key, reply)
+        if embedding and not (self.semantic_exclude and self.semantic_exclude in reply):
+            entries = self._semantic.get(context_key, [])
+            entries = (entries + [(embedding, numbers, reply)])[-self.max_entries_per_context:]
+            self._semantic[context_key] = entries  # Re-insert to refresh TTL